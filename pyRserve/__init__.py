@@ -1,4 +1,5 @@
 """pyRserve package"""
+import sys
 import warnings
 from .version import __version__
 
@@ -6,5 +7,12 @@ from .version import __version__
 warnings.filterwarnings('once', category=DeprecationWarning)
 del warnings
 
-from .rconn import connect
-from .taggedContainers import TaggedList, TaggedArray, AttrArray
+from .rconn import connect, pool, attach
+from .rcluster import cluster, map, RCluster
+if sys.version_info >= (3, 5):
+    # async/await syntax is not available in older Python versions
+    from .rasync import connectAsync, AsyncRConnector
+del sys
+from .taggedContainers import TaggedList, LazyTaggedList, TaggedArray, \
+    AttrArray, Factor
+from .rexceptions import REvalError, RWarning, PyRserveTimeout
@@ -1,8 +1,13 @@
 import sys
+import time
 
 # global variable to indicate whether this is Python3 or not:
 PY3 = sys.version_info[0] == 3
 
+# clock for timeouts which is not affected by changes of the system time
+# (not available in Python2):
+monotonic = getattr(time, 'monotonic', time.time)
+
 
 class FunctionMapper(object):
     """
@@ -55,6 +60,15 @@ def stringEncode(byteData, encoding='utf-8'):
         return byteData
 
 
+def rQuote(aString):
+    """
+    Return a given string as R string literal, i.e. enclosed in double quotes
+    and with backslashes and double quotes escaped
+    """
+    aString = stringEncode(aString)
+    return '"%s"' % aString.replace('\\', '\\\\').replace('"', '\\"')
+
+
 def padLen4(aString):
     """
     Calculate how many additional bytes a given string needs to have a length
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+Module providing an asyncio based connector to a running Rserve instance.
+Requires Python 3.5 or later.
+"""
+import asyncio
+import inspect
+import struct
+###
+from . import rtypes
+from .rexceptions import RConnectionRefused, REvalError, RResponseError, \
+    PyRserveClosed
+from .rserializer import rEval, rAssign, rSerializeResponse, rShutdown
+from .rparser import rparse, OOBMessage
+from .rconn import RSERVEPORT, RSERVE_ID_SIZE, RBaseProxy, \
+    RserveCapabilities, _defaultOOBCallback
+
+
+async def connectAsync(host='', port=RSERVEPORT, atomicArray=False,
+                       oobCallback=_defaultOOBCallback, unixSocket=None):
+    """Open an asyncio based connection to an Rserve instance
+    Params:
+    - host, port, atomicArray, unixSocket: same as for pyRserve.connect()
+    - oobCallback:
+            Same as for pyRserve.connect(). The callback may also be a
+            coroutine function, its result is awaited then.
+    """
+    if host in (None, ''):
+        host = 'localhost'
+    assert port is not None, 'port number must be given'
+    conn = AsyncRConnector(host, port, atomicArray, oobCallback, unixSocket)
+    await conn.connect()
+    return conn
+
+
+class AsyncRConnector(object):
+    """
+    Provide an asyncio network connector to an Rserve process.
+    Data is read from the stream by whole messages, the parsing of messages
+    is done by the same RParser used for the blocking RConnector.
+
+    Calls on one connector are executed one after the other, several
+    connectors can be used concurrently from within one event loop.
+    """
+    def __init__(self, host, port, atomicArray,
+                 oobCallback=_defaultOOBCallback, unixSocket=None):
+        self.host = host
+        self.port = port
+        self.unixSocket = unixSocket
+        self.atomicArray = atomicArray
+        self.oobCallback = oobCallback
+        self._reader = None
+        self._writer = None
+        self._lock = None
+        self.capabilities = None
+        self.__closed = True
+
+    def __repr__(self):
+        txt = 'Closed async handle' if self.isClosed else 'Async handle'
+        if self.unixSocket:
+            return '<%s to Rserve on unix socket %s>' % (txt, self.unixSocket)
+        return '<%s to Rserve on %s:%s>' % \
+               (txt, self.host or 'localhost', self.port)
+
+    @property
+    def isClosed(self):
+        return self.__closed
+
+    async def connect(self):
+        try:
+            if self.unixSocket:
+                self._reader, self._writer = \
+                    await asyncio.open_unix_connection(self.unixSocket)
+            else:
+                self._reader, self._writer = \
+                    await asyncio.open_connection(self.host, self.port)
+        except (OSError, NotImplementedError):
+            raise RConnectionRefused('Connection denied, server not reachable '
+                                     'or not accepting connections')
+        # The lock must be created from within the running event loop:
+        self._lock = asyncio.Lock()
+        try:
+            hdr = await self._reader.readexactly(RSERVE_ID_SIZE)
+        except asyncio.IncompleteReadError:
+            self._writer.close()
+            raise RConnectionRefused('Connection closed by server before '
+                                     'the ID string was received')
+        self.__closed = False
+        self.capabilities = RserveCapabilities.fromIdString(hdr)
+
+    def _checkIfClosed(self):
+        if self.isClosed:
+            raise PyRserveClosed('Connection to Rserve already closed')
+
+    def _markClosed(self):
+        self.__closed = True
+        self._writer.close()
+
+    async def close(self):
+        """Close network connection to rserve"""
+        self._checkIfClosed()
+        self._markClosed()
+
+    async def shutdown(self):
+        self._checkIfClosed()
+        async with self._lock:
+            await self._send(rShutdown())
+        self._markClosed()
+
+    async def _send(self, data):
+        try:
+            self._writer.write(data)
+            await self._writer.drain()
+        except ConnectionError:
+            self._markClosed()
+            raise PyRserveClosed('Connection to Rserve already closed')
+
+    async def _receive(self):
+        """Read one entire QAP1 message (header and data) from the stream"""
+        try:
+            hdr = await self._reader.readexactly(rtypes.RHEADER_SIZE)
+            _, sizeLow, _, sizeHigh = struct.unpack('<IIII', hdr)
+            # The parser creates numeric arrays from a (mutable) bytearray
+            # without copying their data. The stream only returns bytes, so
+            # the data is read into the message piece by piece as it
+            # arrives, instead of concatenating the header and the entire
+            # data part afterwards:
+            message = bytearray(rtypes.RHEADER_SIZE + sizeLow +
+                                (sizeHigh << 32))
+            view = memoryview(message)
+            view[:rtypes.RHEADER_SIZE] = hdr
+            pos = rtypes.RHEADER_SIZE
+            while pos < len(message):
+                data = await self._reader.read(len(message) - pos)
+                if not data:
+                    raise ConnectionError('Connection closed by Rserve')
+                view[pos:pos + len(data)] = data
+                pos += len(data)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            self._markClosed()
+            raise PyRserveClosed('Connection to Rserve already closed')
+        return message
+
+    async def _parseResponse(self, atomicArray):
+        """
+        Parse the response of a request, and handle all OOB messages which
+        are sent by R before the actual result
+        """
+        message = rparse(await self._receive(), atomicArray=atomicArray)
+        while isinstance(message, OOBMessage):
+            ret = self.oobCallback(message.data, message.userCode)
+            if inspect.isawaitable(ret):
+                ret = await ret
+            if message.type == rtypes.OOB_MSG:
+                await self._send(rSerializeResponse(ret))
+            message = rparse(await self._receive(), atomicArray=atomicArray)
+        return message
+
+    async def _request(self, data, atomicArray):
+        """
+        Send a request and return the parsed response. If this fails in
+        between (e.g. since the call has been cancelled) the response might
+        still be pending, so the connection can't be used anymore.
+        """
+        try:
+            await self._send(data)
+            return await self._parseResponse(atomicArray)
+        except (REvalError, RResponseError):
+            # R has answered with an error, the response is complete
+            raise
+        except BaseException:
+            if not self.isClosed:
+                self._markClosed()
+            raise
+
+    async def _eval(self, aString, atomicArray, void):
+        try:
+            return await self._request(rEval(aString, void=void),
+                                       atomicArray)
+        except REvalError:
+            # see RConnector.eval() about obtaining the error message:
+            errorMsg = await self._eval('geterrmessage()', False, False)
+            raise REvalError(errorMsg.strip())
+
+    async def eval(self, aString, atomicArray=None, void=False):
+        """
+        Evaluate a string expression through Rserve and return the result
+        transformed into python objects
+        """
+        self._checkIfClosed()
+        if type(aString) not in rtypes.STRING_TYPES + [bytes]:
+            raise TypeError('Only string evaluation is allowed')
+        if atomicArray is None:
+            atomicArray = self.atomicArray
+        async with self._lock:
+            return await self._eval(aString, atomicArray, void)
+
+    async def voidEval(self, aString):
+        """
+        Evaluate a string expression through Rserve without returning
+        any result data
+        """
+        await self.eval(aString, void=True)
+
+    async def _setRexp(self, name, o):
+        await self._request(rAssign(name, o), self.atomicArray)
+
+    async def setRexp(self, name, o):
+        """
+        Convert a python object into an RExp and bind it to a variable
+        called "name" in the R namespace
+        """
+        self._checkIfClosed()
+        async with self._lock:
+            await self._setRexp(name, o)
+
+    async def getRexp(self, name):
+        """Retrieve a Rexp stored in a variable called 'name'"""
+        return await self.eval(name)
+
+    async def callFunc(self, name, *args, **kw):
+        """
+        Make a call to a function "name" through Rserve, see
+        RConnector.callFunc() for details.
+        """
+        self._checkIfClosed()
+        async with self._lock:
+            argNames = []
+            for idx, arg in enumerate(args):
+                if isinstance(arg, RBaseProxy):
+                    argName = arg.__name__
+                else:
+                    argName = 'arg_%d_' % idx
+                    await self._setRexp(argName, arg)
+                argNames.append(argName)
+            for key, value in kw.items():
+                if isinstance(value, RBaseProxy):
+                    argName = value.__name__
+                else:
+                    argName = 'kwarg_%s_' % key
+                    await self._setRexp(argName, value)
+                argNames.append('%s=%s' % (key, argName))
+            return await self._eval(name + '(%s)' % ', '.join(argNames),
+                                    self.atomicArray, False)
+
+    async def assign(self, aDict):
+        """Assign all items of the dictionary to the default R namespace"""
+        for k, v in aDict.items():
+            await self.setRexp(k, v)
+
+    async def isFunction(self, name):
+        """Check whether given name references an existing function in R"""
+        return await self.eval('is.function(%s)' % name)
@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""
+Module providing client-side load balancing of calls across several Rserve
+instances, and parallel mapping of data over several connections
+"""
+import contextlib
+import socket
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+###
+from .rexceptions import RConnectionRefused, PyRserveClosed, RPoolExhausted
+from .rconn import RSERVEPORT, RConnectorPool, RFuncProxy
+from .misc import monotonic
+
+# Policies for choosing the Rserve instance which handles the next call:
+LEAST_OUTSTANDING = 'least-outstanding'
+ROUND_ROBIN = 'round-robin'
+POLICIES = (LEAST_OUTSTANDING, ROUND_ROBIN)
+# Number of seconds to wait for a connection of an instance in turn, while all
+# instances of a cluster are busy:
+WAIT_INTERVAL = 0.05
+
+
+def map(func, iterable, connections=4, chunkSize=None, pool=None,
+        host='', port=RSERVEPORT, **kw):
+    """Apply an R function to all items of an iterable in parallel, using
+    several connections (a Python-side parLapply). Results are returned as
+    a list in the order of the items.
+    Params:
+    - func: name of an R function (e.g. 'sqrt'), an R expression evaluating
+            to a function (e.g. 'function(x) x^2') or an RFuncProxy
+    - iterable: the items, each of them is passed to func separately
+    - connections: number of connections used at the same time
+    - chunkSize: number of items sent to R with one call. By default the
+            items are split into 4 chunks per connection, to balance the
+            overhead per call against an even distribution of work.
+    - pool: an RConnectorPool or RCluster providing the connections. If not
+            given, a temporary pool of 'connections' connections to
+            host/port is created. All further keyword arguments are passed on
+            to pool() then.
+
+    Usage:
+        pyRserve.map('function(x) x^2', range(10000), connections=8)
+    """
+    items = list(iterable)
+    if not items:
+        return []
+    if chunkSize is None:
+        chunkSize = -(-len(items) // (connections * 4))
+    chunks = [items[idx:idx + chunkSize]
+              for idx in range(0, len(items), chunkSize)]
+    funcName = func.__name__ if isinstance(func, RFuncProxy) else func
+
+    def applyChunk(chunk):
+        with source.connection() as conn:
+            # The proxy just inserts the function name or expression into
+            # the call, so that no additional variable is needed in R:
+            return conn.callFunc('lapply', chunk, RFuncProxy(funcName, conn))
+
+    source = pool
+    if source is None:
+        source = RConnectorPool(host, port, connections, **kw)
+    threadPool = ThreadPool(connections)
+    try:
+        chunkResults = threadPool.map(applyChunk, chunks)
+    finally:
+        threadPool.close()
+        if pool is None:
+            source.close()
+    return [result for chunkResult in chunkResults for result in chunkResult]
+
+
+def cluster(endpoints, policy=LEAST_OUTSTANDING, connectionsPerHost=2,
+            init=None, retryInterval=30, **kw):
+    """Create a cluster of connections to several Rserve instances
+    Params:
+    - endpoints: list of (host, port) tuples of Rserve instances
+    - policy: how to pick the instance for the next call, either
+              LEAST_OUTSTANDING (the one with the fewest calls currently
+              running) or ROUND_ROBIN
+    - connectionsPerHost: number of connections kept open to every instance
+    - init: same as for pool()
+    - retryInterval: number of seconds an instance is skipped after it could
+              not be reached, before it is tried again
+    All other keyword arguments are passed on to connect().
+
+    Usage:
+        c = pyRserve.cluster([('rhost1', 6311), ('rhost2', 6311)])
+        c.eval('1+1')
+        c.callFunc('sum', [1, 2, 3])
+        with c.connection() as conn:
+            conn.r.x = 1
+            conn.r('x+1')
+    """
+    return RCluster(endpoints, policy, connectionsPerHost, init,
+                    retryInterval, **kw)
+
+
+class REndpoint(object):
+    """State of a single Rserve instance within a cluster"""
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.pool = None
+        self.outstanding = 0
+        self.downUntil = None
+
+    def __repr__(self):
+        state = 'up' if self.isUp else 'down'
+        return '<REndpoint %s:%s (%s, %d outstanding)>' % \
+               (self.host, self.port, state, self.outstanding)
+
+    @property
+    def isUp(self):
+        return self.downUntil is None
+
+
+class RCluster(object):
+    """
+    Thread-safe dispatcher of calls across several Rserve instances. Every
+    instance is accessed through its own RConnectorPool. Instances which
+    can't be reached are marked as down and skipped, until they are probed
+    again after 'retryInterval' seconds.
+
+    Note that every call may be handled by a different R session, so calls
+    depending on each other should be made via one connection obtained by
+    connection().
+    """
+    def __init__(self, endpoints, policy=LEAST_OUTSTANDING,
+                 connectionsPerHost=2, init=None, retryInterval=30,
+                 **connectArgs):
+        if not endpoints:
+            raise ValueError('At least one endpoint must be given')
+        if policy not in POLICIES:
+            raise ValueError('Unknown policy "%s", use one of %s' %
+                             (policy, ', '.join(POLICIES)))
+        self.endpoints = [REndpoint(host or 'localhost', port or RSERVEPORT)
+                          for host, port in endpoints]
+        self.policy = policy
+        self.connectionsPerHost = connectionsPerHost
+        self.init = init
+        self.retryInterval = retryInterval
+        self.connectArgs = connectArgs
+        self._lock = threading.Lock()
+        self._nextIdx = 0
+        self.__closed = False
+
+    def __repr__(self):
+        txt = 'Closed cluster' if self.isClosed else 'Cluster'
+        return '<%s of %d Rserve instances (%s)>' % \
+               (txt, len(self.endpoints), self.policy)
+
+    @property
+    def isClosed(self):
+        return self.__closed
+
+    def _candidates(self):
+        """
+        Return all endpoints which may be used, in the order in which they
+        should be tried. Must be called with the lock held.
+        """
+        now = time.time()
+        available = [e for e in self.endpoints
+                     if e.isUp or e.downUntil <= now]
+        # rotate the list, so that ties are resolved in a round-robin manner:
+        start = self._nextIdx % len(self.endpoints)
+        self._nextIdx += 1
+        available = [e for e in self.endpoints[start:] + self.endpoints[:start]
+                     if e in available]
+        if self.policy == LEAST_OUTSTANDING:
+            # sort() is stable, so ties keep the round-robin order:
+            available.sort(key=lambda e: e.outstanding)
+        return available
+
+    def _markDown(self, endpoint):
+        with self._lock:
+            endpoint.downUntil = time.time() + self.retryInterval
+            pool, endpoint.pool = endpoint.pool, None
+        if pool is not None:
+            pool.close()
+
+    def _getPool(self, endpoint):
+        """Return the connection pool of an endpoint, create it if needed"""
+        pool = endpoint.pool
+        if pool is None:
+            # opening connections might take a while, so don't hold the lock:
+            pool = RConnectorPool(endpoint.host, endpoint.port,
+                                  self.connectionsPerHost, self.init,
+                                  **self.connectArgs)
+            with self._lock:
+                if endpoint.pool is None:
+                    endpoint.pool, surplusPool = pool, None
+                else:
+                    # another thread has been faster
+                    surplusPool, pool = pool, endpoint.pool
+            if surplusPool is not None:
+                surplusPool.close()
+        return pool
+
+    def _acquire(self, timeout=None):
+        """
+        Pick an endpoint according to the policy and obtain a connection to
+        it. Return the endpoint, its pool and the connection. If all
+        instances are busy, wait until any of them has a connection
+        available, or raise RPoolExhausted after 'timeout' seconds.
+        """
+        if self.isClosed:
+            raise PyRserveClosed('Cluster already closed')
+        deadline = None if timeout is None else monotonic() + timeout
+        # the first round doesn't wait for busy instances at all:
+        wait = 0
+        while True:
+            with self._lock:
+                candidates = self._candidates()
+            busy = False
+            for endpoint in candidates:
+                with self._lock:
+                    # count the call right away, so that concurrent callers
+                    # take it into account:
+                    endpoint.outstanding += 1
+                try:
+                    pool = self._getPool(endpoint)
+                    conn = pool.acquire(timeout=wait)
+                except RPoolExhausted:
+                    # all connections to the instance are in use, try the
+                    # next one:
+                    self._release(endpoint)
+                    busy = True
+                    continue
+                except (RConnectionRefused, PyRserveClosed, socket.error):
+                    # instance not reachable, try the next one:
+                    self._release(endpoint)
+                    self._markDown(endpoint)
+                    continue
+                except BaseException:
+                    # e.g. a failing init, the call didn't take place:
+                    self._release(endpoint)
+                    raise
+                with self._lock:
+                    endpoint.downUntil = None
+                return endpoint, pool, conn
+            if not busy:
+                raise RConnectionRefused('None of the Rserve instances of '
+                                         'the cluster is reachable')
+            # Wait for a connection of every instance in turn, so that the
+            # first one released anywhere is taken:
+            wait = WAIT_INTERVAL
+            if deadline is not None:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    raise RPoolExhausted('No connection available in cluster '
+                                         'after waiting %s seconds' % timeout)
+                wait = min(wait, remaining / len(candidates))
+
+    def _release(self, endpoint, pool=None, conn=None):
+        with self._lock:
+            endpoint.outstanding -= 1
+        if conn is not None:
+            # if the pool has been closed in the meantime (since the endpoint
+            # has been marked as down) it discards the connection:
+            pool.release(conn)
+
+    @contextlib.contextmanager
+    def connection(self, timeout=None):
+        """
+        Context manager providing a connection to one of the Rserve instances
+        of the cluster (chosen according to the policy) for the duration of
+        the `with` block. Dead connections are replaced by their pools, an
+        instance is only marked as down if no new connection can be opened.
+        If all connections are in use, the first one released by any instance
+        is taken. RPoolExhausted is raised if none becomes available within
+        'timeout' seconds.
+        """
+        endpoint, pool, conn = self._acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self._release(endpoint, pool, conn)
+
+    def eval(self, aString, *args, **kw):
+        """Evaluate a string expression on one of the Rserve instances"""
+        with self.connection() as conn:
+            return conn.eval(aString, *args, **kw)
+
+    def voidEval(self, aString):
+        """
+        Evaluate a string expression on one of the Rserve instances without
+        returning any result data
+        """
+        with self.connection() as conn:
+            conn.voidEval(aString)
+
+    def callFunc(self, name, *args, **kw):
+        """Call the R function 'name' on one of the Rserve instances"""
+        with self.connection() as conn:
+            return conn.callFunc(name, *args, **kw)
+
+    def close(self):
+        """Close the connections to all Rserve instances"""
+        self.__closed = True
+        for endpoint in self.endpoints:
+            with self._lock:
+                pool, endpoint.pool = endpoint.pool, None
+            if pool is not None:
+                pool.close()
@@ -2,17 +2,73 @@
 """
 Module providing functionality to connect to a running Rserve instance
 """
+import contextlib
+import io
 import socket
-import time
+import select
 import pydoc
+import warnings
+try:
+    import queue
+except ImportError:
+    # Python 2.x
+    import Queue as queue
 ###
 from . import rtypes
-from .rexceptions import RConnectionRefused, REvalError, PyRserveClosed
-from .rserializer import rEval, rAssign, rSerializeResponse, rShutdown
-from .rparser import rparse, OOBMessage
-from .misc import hexString
+from .rexceptions import RConnectionRefused, REvalError, RResponseError, \
+    PyRserveClosed, PyRserveTimeout, RPoolExhausted, RBatchEvalError, RWarning
+from .taggedContainers import TaggedList
+from .rserializer import rEval, rAssign, rSerializeResponse, rShutdown, \
+    rDetachSession, rDetachedVoidEval, rOpenFile, rCreateFile, rCloseFile, \
+    rReadFile, rWriteFile, rRemoveFile, rSetBufferSize
+from .rparser import rparse, rparseRaw, OOBMessage, SocketReader
+from .misc import PY3, hexString, stringEncode, rQuote, monotonic
 
 RSERVEPORT = 6311
+RSERVE_ID_SIZE = 32
+FILE_BUFFER_SIZE = 1024 * 1024  # default chunk size for file transfers
+CALL_ARGS_NAME = '.pyRserveArgs_'  # R variable for packed function arguments
+# Max. number of bytes of statements evalMany() sends before reading their
+# responses. This must fit into the socket buffers, otherwise Rserve might
+# block on sending responses while pyRserve blocks on sending statements:
+BATCH_WINDOW_SIZE = 64 * 1024
+# Kinds of objects a name can reference in R (see RConnector.lookupName()):
+NAME_FUNCTION = 'function'
+NAME_VARIABLE = 'variable'
+# R code returning all names visible from the global environment together with
+# a flag whether they reference a function (first match on search path wins):
+R_LIST_NAMES = '''local({
+    nms <- character(0); fns <- logical(0)
+    for (e in search()) {
+        env <- as.environment(e)
+        n <- setdiff(ls(env, all.names=TRUE), nms)
+        nms <- c(nms, n)
+        fns <- c(fns, vapply(n, function(x) is.function(get(x, envir=env)),
+                             TRUE, USE.NAMES=FALSE))
+    }
+    list(nms, fns)
+})'''
+# R code evaluating an expression while catching errors and warnings, which
+# are returned together with the result (see RConnector._evalTrapped()). Like
+# R's own error messages only the first line of the failed call is reported,
+# since calls may contain entire argument vectors (e.g. calls via do.call()):
+R_TRAP_ERRORS = '''local({
+    .warnings <- character(0)
+    .result <- withCallingHandlers(
+        tryCatch(list(TRUE, %s),
+                 error=function(e) {
+                     cl <- conditionCall(e)
+                     list(FALSE, conditionMessage(e),
+                          if (is.null(cl)) NULL
+                          else deparse(cl, nlines=1L),
+                          class(e))
+                 }),
+        warning=function(w) {
+            .warnings <<- c(.warnings, conditionMessage(w))
+            invokeRestart('muffleWarning')
+        })
+    c(.result, list(.warnings))
+})'''
 DEBUG = False
 
 
@@ -38,7 +94,9 @@ class OOBCallback(object):
 
 
 def connect(host='', port=RSERVEPORT, atomicArray=False, defaultVoid=False,
-            oobCallback=_defaultOOBCallback):
+            oobCallback=_defaultOOBCallback, unixSocket=None,
+            packCallArgs=False, cacheNames=False, trapErrors=False,
+            timeout=None, dataFrames=False, na=None):
     """Open a connection to an Rserve instance
     Params:
     - host: provide hostname where Rserve runs, or leave as empty string to
@@ -60,6 +118,42 @@ def connect(host='', port=RSERVEPORT, atomicArray=False, defaultVoid=False,
             parameters. If self.oobMessage was used, the result value of the
             callback is sent back to R.
             Default: lambda data, code=0: None (oobMessage will return NULL)
+    - unixSocket:
+            Path of a unix domain socket Rserve is listening on (Rserve
+            configuration option 'socket'). If given, host and port are
+            ignored.
+    - packCallArgs:
+            If True, function calls via conn.r.<func>(...) or conn.callFunc()
+            send all arguments packed into one list together with the call
+            itself, so a call costs only one network round-trip regardless
+            of the number of arguments. Default: False
+    - cacheNames:
+            If True, remember whether names accessed via conn.r.<name> and
+            conn.ref.<name> reference functions or variables in R, as well
+            as help texts of functions, instead of querying R every time.
+            The cache is reset whenever R code is evaluated via eval(),
+            voidEval() or evalMany(). Default: False
+    - trapErrors:
+            If True, expressions are evaluated within R's tryCatch(), so that
+            error messages (and warnings) are returned together with the
+            result instead of being fetched with an additional network
+            round-trip. Errors are raised as REvalError with the R call and
+            condition classes attached, R warnings are issued as Python
+            warnings of category RWarning. Default: False
+    - timeout:
+            Number of seconds any blocking network operation (including
+            waiting for the result of an R call) may take before
+            PyRserveTimeout is raised and the connection is closed. See also
+            RConnector.deadline(). Default: None (block forever)
+    - dataFrames:
+            If True, data.frames are returned as pandas DataFrames instead of
+            TaggedLists of their columns (requires pandas). Default: False
+    - na:
+            If 'mask', integer, double, logical and string arrays are
+            returned as numpy masked arrays in which R's NA values are
+            masked. By default NA values remain in the data as they are
+            sent by R (e.g. rtypes.INT_NA), NA strings become None.
+            Default: None
     """
     if host in (None, ''):
         # On Win32 it seems that passing an empty string as 'localhost' does
@@ -67,20 +161,188 @@ def connect(host='', port=RSERVEPORT, atomicArray=False, defaultVoid=False,
         # or '' were passed.
         host = 'localhost'
     assert port is not None, 'port number must be given'
-    return RConnector(host, port, atomicArray, defaultVoid, oobCallback)
+    return RConnector(host, port, atomicArray, defaultVoid, oobCallback,
+                      unixSocket, packCallArgs=packCallArgs,
+                      cacheNames=cacheNames, trapErrors=trapErrors,
+                      timeout=timeout, dataFrames=dataFrames, na=na)
+
+
+def attach(sessionKey, atomicArray=False, defaultVoid=False,
+           oobCallback=_defaultOOBCallback, packCallArgs=False,
+           cacheNames=False, trapErrors=False, timeout=None,
+           dataFrames=False, na=None):
+    """Resume an R session which has been detached via conn.detach() or
+    conn.detachedVoidEval()
+    Params:
+    - sessionKey: the RSessionKey returned by detach() / detachedVoidEval()
+    All other parameters are the same as for connect().
+
+    Note: Rserve only accepts the session to be resumed from the same IP
+          address it was detached from.
+    """
+    return RConnector(sessionKey.host, sessionKey.rservePort, atomicArray,
+                      defaultVoid, oobCallback, session=sessionKey,
+                      packCallArgs=packCallArgs, cacheNames=cacheNames,
+                      trapErrors=trapErrors, timeout=timeout,
+                      dataFrames=dataFrames, na=na)
+
+
+class RSessionKey(object):
+    """
+    Key of a detached R session, as needed by pyRserve.attach().
+    - host: host Rserve runs on
+    - port: port Rserve listens on for resuming the session
+    - key:  32 bytes session key
+    - rservePort: port of the regular Rserve the session was detached from
+    """
+    def __init__(self, host, port, key, rservePort=RSERVEPORT):
+        self.host = host
+        self.port = port
+        self.key = key
+        self.rservePort = rservePort
+
+    def __repr__(self):
+        return '<RSessionKey for Rserve on %s:%s>' % (self.host, self.port)
+
+
+def pool(host='', port=RSERVEPORT, size=4, init=None, **kw):
+    """Open a pool of connections to an Rserve instance
+    Params:
+    - host, port: same as for connect()
+    - size: number of connections kept open by the pool
+    - init: R code (a string) or a callable taking the connection as its only
+            argument. It is applied to every new connection, e.g. to load
+            libraries or data, before the connection is handed out.
+    All other keyword arguments are passed on to connect().
+
+    Usage:
+        p = pyRserve.pool(size=8, init='library(stats)')
+        with p.connection() as conn:
+            conn.r('1+1')
+    """
+    return RConnectorPool(host, port, size, init, **kw)
+
+
+def _recvExactly(sock, size):
+    """Receive exactly 'size' bytes from a socket"""
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise socket.error('Connection closed by Rserve')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+class RserveCapabilities(object):
+    """
+    Information parsed from the 32 bytes ID string Rserve sends when a
+    connection has been opened, e.g. 'Rsrv0103QAP1\r\n\r\n--------------\r\n'
+
+        [ 0-3 ] 'Rsrv'
+        [ 4-7 ] protocol version, e.g. '0103'
+        [ 8-11] protocol, 'QAP1'
+        [12-31] attributes (4 bytes each), e.g. 'ARpt', padded by
+                '\r\n\r\n' and '-'
+
+    Known attributes:
+    - ARpt: authorization required, plain text password
+    - ARuc: authorization required, unix crypt password
+    - K***: key for crypt (*** is the key)
+    - TLS:  server supports switching the connection to TLS
+    """
+    def __init__(self, version, protocol, attributes):
+        self.version = version
+        self.protocol = protocol
+        self.attributes = attributes
+
+    @classmethod
+    def fromIdString(cls, idString):
+        # make sure we are really connected with rserv
+        assert idString.startswith(b'Rsrv'), \
+            'Protocol error with Rserv, obtained invalid header string'
+        version = stringEncode(idString[4:8])
+        protocol = stringEncode(idString[8:12])
+        assert protocol == 'QAP1', \
+            'Unsupported Rserve protocol "%s"' % protocol
+        attributes = []
+        for pos in range(12, len(idString), 4):
+            attr = stringEncode(idString[pos:pos+4].rstrip(b'\0'))
+            if attr.strip('-\r\n'):
+                attributes.append(attr)
+        return cls(version, protocol, attributes)
+
+    def __repr__(self):
+        return '<RserveCapabilities version=%s protocol=%s attributes=%s>' % \
+               (self.version, self.protocol, self.attributes)
+
+    @property
+    def versionNumber(self):
+        """Protocol version as an integer, e.g. 103 for '0103'"""
+        return int(self.version)
+
+    @property
+    def authRequired(self):
+        return self.plainTextAuth or self.unixCryptAuth
+
+    @property
+    def plainTextAuth(self):
+        return 'ARpt' in self.attributes
+
+    @property
+    def unixCryptAuth(self):
+        return 'ARuc' in self.attributes
+
+    @property
+    def cryptKey(self):
+        for attr in self.attributes:
+            if attr.startswith('K'):
+                return attr[1:].rstrip('-')
+        return None
+
+    @property
+    def tls(self):
+        return any(attr.startswith('TLS') for attr in self.attributes)
+
+
+def _asList(value):
+    """
+    Return the items of a (possibly atomic) vector returned from R as list,
+    e.g. 'a' -> ['a'], array(['a', 'b']) -> ['a', 'b']
+    """
+    if isinstance(value, tuple(rtypes.STRING_TYPES)) or \
+            isinstance(value, bool):
+        return [value]
+    return list(value)
 
 
 def checkIfClosed(func):
     def decoCheckIfClosed(self, *args, **kw):
         if self.isClosed:
             raise PyRserveClosed('Connection to Rserve already closed')
+        if self._deadline is not None:
+            # within a deadline() block: only the remaining time is left
+            remaining = self._deadline - monotonic()
+            if remaining <= 0:
+                raise PyRserveTimeout('Deadline for Rserve calls exceeded')
+            self.sock.settimeout(remaining)
+        # the reader shortens the timeout before every recv():
+        self._reader.deadline = self._deadline
         try:
             return func(self, *args, **kw)
+        except socket.timeout:
+            # It is unknown which part of the response to the request is
+            # still to come, so the connection can't be used anymore:
+            self.poisoned = True
+            self._close()
+            raise PyRserveTimeout('No response from Rserve in time, '
+                                  'connection has been closed')
         except socket.error as msg:
             if msg.strerror in ['Connection reset by peer', 'Broken pipe']:
                 # seems like the connection to Rserve has died, so mark
                 # the connection as closed
-                self.close()
+                self._close()
                 raise PyRserveClosed('Connection to Rserve already closed')
             else:
                 raise
@@ -90,20 +352,40 @@ def checkIfClosed(func):
 class RConnector(object):
     """Provide a network connector to an Rserve process"""
     def __init__(self, host, port, atomicArray, defaultVoid,
-                 oobCallback=_defaultOOBCallback):
+                 oobCallback=_defaultOOBCallback, unixSocket=None,
+                 session=None, packCallArgs=False, cacheNames=False,
+                 trapErrors=False, timeout=None, dataFrames=False,
+                 na=None):
         self.sock = None
+        self._reader = None
         self.__closed = True
         self.host = host
         self.port = port
+        self.unixSocket = unixSocket
         self.atomicArray = atomicArray
         self.defaultVoid = defaultVoid
         self.oobCallback = oobCallback
+        self.packCallArgs = packCallArgs
+        self.cacheNames = cacheNames
+        self.trapErrors = trapErrors
+        self.timeout = timeout
+        self.dataFrames = dataFrames
+        self.na = na
+        # set when a timeout has left the stream at an unknown position:
+        self.poisoned = False
+        self._deadline = None
+        self._nameCache = {}
+        self._helpCache = {}
+        self.capabilities = None
+        self._session = session
         self.r = RNameSpace(self)
         self.ref = RNameSpaceReference(self)
         self.connect()
 
     def __repr__(self):
         txt = 'Closed handle' if self.isClosed else 'Handle'
+        if self.unixSocket:
+            return '<%s to Rserve on unix socket %s>' % (txt, self.unixSocket)
         return '<%s to Rserve on %s:%s>' % \
                (txt, self.host or 'localhost', self.port)
 
@@ -112,26 +394,64 @@ class RConnector(object):
         return self.__closed
 
     def connect(self):
-        self.sock = socket.socket()
+        if self._session:
+            # resume a detached session. Rserve listens on a dedicated port
+            # for this, and expects the session key as the very first data:
+            self.sock = socket.socket()
+            address = (self._session.host, self._session.port)
+        elif self.unixSocket:
+            if not hasattr(socket, 'AF_UNIX'):
+                raise RConnectionRefused('Unix domain sockets are not '
+                                         'supported on this platform')
+            self.sock = socket.socket(socket.AF_UNIX)
+            address = self.unixSocket
+        else:
+            self.sock = socket.socket()
+            address = (self.host, self.port)
+        self.sock.settimeout(self.timeout)
+        # all responses are read through a buffer kept with the connection:
+        self._reader = SocketReader(self.sock)
+        self.poisoned = False
         try:
-            self.sock.connect((self.host, self.port))
+            self.sock.connect(address)
         except socket.error:
             raise RConnectionRefused('Connection denied, server not reachable '
                                      'or not accepting connections')
-        time.sleep(0.2)
-        hdr = self.sock.recv(1024)
+        if self._session:
+            self._attachSession()
+            return
+        # Rserve greets every new connection with its ID string. The
+        # connection is usable as soon as this has been received completely:
+        try:
+            hdr = _recvExactly(self.sock, RSERVE_ID_SIZE)
+        except socket.error:
+            self.sock.close()
+            raise RConnectionRefused('Connection closed by server before '
+                                     'the ID string was received')
         self.__closed = False
         if DEBUG:
             print('received hdr %s from rserve' % hdr)
-        # make sure we are really connected with rserv
-        assert hdr.startswith(b'Rsrv01'), \
-            'Protocol error with Rserv, obtained invalid header string'
-        # TODO: possibly also do version checking here to make sure we
-        #       understand the protocol...
+        self.capabilities = RserveCapabilities.fromIdString(hdr)
+
+    def _attachSession(self):
+        self.sock.sendall(self._session.key)
+        try:
+            # Rserve confirms the session key with an empty response:
+            rparse(self._reader)
+        except:
+            self.sock.close()
+            raise
+        self.__closed = False
+        # A session key can only be used once. Further calls to connect()
+        # open a new session on the regular Rserve port:
+        self._session = None
 
     @checkIfClosed
     def close(self):
         """Close network connection to rserve"""
+        self._close()
+
+    def _close(self):
         self.sock.close()
         self.__closed = True
 
@@ -140,6 +460,32 @@ class RConnector(object):
         rShutdown(fp=self.sock)
         self.close()
 
+    def _detach(self):
+        # Rserve responds with the port to reconnect to, and the session key:
+        port, key = rparse(self._reader)
+        self.close()
+        return RSessionKey(self.host, port, key, self.port)
+
+    @checkIfClosed
+    def detach(self):
+        """
+        Detach from the R session, keeping all its data alive in Rserve. The
+        connection is closed, the returned session key can be passed to
+        pyRserve.attach() for resuming the session.
+        """
+        rDetachSession(fp=self.sock)
+        return self._detach()
+
+    @checkIfClosed
+    def detachedVoidEval(self, aString):
+        """
+        Detach from the R session and evaluate a string expression in it
+        afterwards, e.g. to run a long computation without keeping the
+        connection open. Returns a session key like detach().
+        """
+        rDetachedVoidEval(aString, fp=self.sock)
+        return self._detach()
+
     def _reval(self, aString, void):
         rEval(aString, fp=self.sock, void=void)
 
@@ -147,49 +493,257 @@ class RConnector(object):
         rSerializeResponse(aObj, fp=self.sock)
 
     @checkIfClosed
-    def eval(self, aString, atomicArray=None, void=False):
+    def eval(self, aString, atomicArray=None, void=False, trapErrors=None,
+             deadline=None, lazy=False, spillDir=None, dataFrames=None,
+             na=None):
         """
         Evaluate a string expression through Rserve and return the result
-        transformed into python objects
+        transformed into python objects. 'trapErrors' overrides the setting
+        of the connection (see connect()), 'deadline' limits the time the
+        evaluation may take (see deadline()). With 'lazy' lists are returned
+        as LazyTaggedLists, whose items are only converted when accessed.
+        With 'spillDir' large numeric arrays are received into .npy files in
+        this directory, and returned as numpy.memmap. 'dataFrames' and 'na'
+        override the settings of the connection (see connect()).
+        """
+        if deadline is not None:
+            with self.deadline(deadline):
+                return self.eval(aString, atomicArray, void, trapErrors,
+                                 lazy=lazy, spillDir=spillDir,
+                                 dataFrames=dataFrames, na=na)
+        # the expression might (re)define anything in R:
+        self._nameCache.clear()
+        return self._eval(aString, atomicArray, void, trapErrors, lazy,
+                          spillDir, dataFrames, na)
+
+    @contextlib.contextmanager
+    def deadline(self, seconds):
         """
+        Context manager limiting the time all calls to Rserve within the
+        `with` block may take, e.g.:
+            with conn.deadline(5):
+                conn.r.slowFunc(x)
+        The remaining time is checked at the start of every call and before
+        receiving any data, and no network operation may block for longer
+        than the time remaining. If the time is exceeded PyRserveTimeout is
+        raised. If this happens while waiting for a response the connection
+        is closed (and marked as poisoned), since the state of the data
+        stream is unknown then.
+        """
+        outerDeadline = self._deadline
+        self._deadline = monotonic() + seconds
+        if outerDeadline is not None:
+            self._deadline = min(self._deadline, outerDeadline)
+        try:
+            yield self
+        finally:
+            self._deadline = outerDeadline
+            if not self.isClosed:
+                self._reader.deadline = outerDeadline
+                if outerDeadline is None:
+                    self.sock.settimeout(self.timeout)
+                else:
+                    self.sock.settimeout(max(outerDeadline - monotonic(),
+                                             0.001))
+
+    def _eval(self, aString, atomicArray=None, void=False, trapErrors=None,
+              lazy=False, spillDir=None, dataFrames=None, na=None):
         if not type(aString in rtypes.STRING_TYPES):
             raise TypeError('Only string evaluation is allowed')
+        if trapErrors is None:
+            trapErrors = self.trapErrors
+        if trapErrors:
+            return self._evalTrapped(aString, atomicArray, void, lazy,
+                                     spillDir, dataFrames, na)
         self._reval(aString, void)
         if DEBUG:
             # Read entire data into memory en bloque, it's easier to debug
             src = self._receive()
             print('Raw response: %s' % hexString(src))
         else:
-            src = self.sock
+            src = self._reader
 
         if atomicArray is None:
             # if not specified, use the global default:
             atomicArray = self.atomicArray
 
         try:
-            message = rparse(src, atomicArray=atomicArray)
-            # Before the result is returned, 0-∞ OOB messages may be sent
-            while isinstance(message, OOBMessage):
-                if DEBUG:
-                    print('OOB Message received:', message)
-                ret = self.oobCallback(message.data, message.userCode)
-                if message.type == rtypes.OOB_MSG:
-                    self._rrespond(ret)
-
-                if isinstance(src, (str, bytes)):
-                    # This is no stream, so we have to cut off data
-                    src = src[len(message):]
-
-                message = rparse(src, atomicArray=atomicArray)
-            return message
+            return self._parseResponse(src, atomicArray, lazy, spillDir,
+                                       dataFrames, na)
         except REvalError:
             # R has reported an evaluation error, so let's obtain a descriptive
             # explanation about why the error has occurred. R allows to
             # retrieve the error message of the last exception via a built-in
             # function called 'geterrmessage()'.
-            errorMsg = self.eval('geterrmessage()').strip()
+            errorMsg = self._eval('geterrmessage()', trapErrors=False).strip()
             raise REvalError(errorMsg)
 
+    def _evalTrapped(self, aString, atomicArray, void, lazy=False,
+                     spillDir=None, dataFrames=None, na=None):
+        """
+        Evaluate a string expression wrapped into R code which catches errors
+        and warnings, and returns them within the same response
+        """
+        result = self._eval(self._trapExpr(aString, void), atomicArray,
+                            trapErrors=False, lazy=lazy, spillDir=spillDir,
+                            dataFrames=dataFrames, na=na)
+        return self._trappedResult(result)
+
+    @staticmethod
+    def _trapExpr(aString, void):
+        """Return R code evaluating aString while trapping errors"""
+        expr = 'eval(parse(text=%s), envir=globalenv())' % rQuote(aString)
+        if void:
+            expr = '{%s; NULL}' % expr
+        return R_TRAP_ERRORS % expr
+
+    @staticmethod
+    def _trappedResult(result):
+        """
+        Return the actual result of an expression evaluated with trapped
+        errors, or raise the error. Warnings are issued as RWarnings.
+        """
+        for warning in _asList(result[-1]):
+            warnings.warn(warning, RWarning, stacklevel=5)
+        if _asList(result[0]) != [False]:
+            return result[1]
+        message, call, classes = result[1:4]
+        message = _asList(message)[0]
+        if call is not None:
+            call = _asList(call)[0]
+            errorMsg = 'Error in %s : %s' % (call, message)
+        else:
+            errorMsg = 'Error: %s' % message
+        raise REvalError(errorMsg, call, _asList(classes))
+
+    def _parseResponse(self, src, atomicArray, lazy=False, spillDir=None,
+                       dataFrames=None, na=None):
+        """
+        Parse the response to a request. Before the actual result is returned
+        R may send any number of OOB messages which are handled here.
+        """
+        if dataFrames is None:
+            dataFrames = self.dataFrames
+        if na is None:
+            na = self.na
+        message = rparse(src, atomicArray=atomicArray, lazy=lazy,
+                         spillDir=spillDir, dataFrames=dataFrames,
+                         na=na)
+        # Before the result is returned, 0-∞ OOB messages may be sent
+        while isinstance(message, OOBMessage):
+            if DEBUG:
+                print('OOB Message received:', message)
+            ret = self.oobCallback(message.data, message.userCode)
+            if message.type == rtypes.OOB_MSG:
+                self._rrespond(ret)
+
+            if isinstance(src, (str, bytes)):
+                # This is no stream, so we have to cut off data
+                src = src[len(message):]
+
+            message = rparse(src, atomicArray=atomicArray, lazy=lazy,
+                             spillDir=spillDir, dataFrames=dataFrames,
+                             na=na)
+        return message
+
+    @checkIfClosed
+    def evalMany(self, statements, atomicArray=None, void=False,
+                 trapErrors=None):
+        """
+        Send several statements to Rserve at once and collect their results
+        afterwards, so that all of them only cost one network round-trip
+        (statements of more than BATCH_WINDOW_SIZE bytes are sent in several
+        rounds).
+        Every item of 'statements' is either
+        - a string, which is evaluated like in eval(), or
+        - a tuple (name, value), which is assigned like in setRexp().
+        Results are returned as a list in the same order as the statements,
+        assignments (and all evaluations if void=True) result in None.
+
+        If R raises errors for some of the statements the remaining ones are
+        still executed. Once all responses have been read RBatchEvalError is
+        raised which tells which statements failed. 'trapErrors' overrides
+        the setting of the connection (see connect()).
+
+        Note: Statements must not call self.oobMessage() since Rserve would
+              take the subsequent statements as the answer to it.
+        """
+        self._nameCache.clear()
+        return self._evalMany(statements, atomicArray, void, trapErrors)
+
+    def _evalMany(self, statements, atomicArray=None, void=False,
+                  trapErrors=None):
+        if atomicArray is None:
+            atomicArray = self.atomicArray
+        if trapErrors is None:
+            trapErrors = self.trapErrors
+        frames = []
+        for statement in statements:
+            if isinstance(statement, tuple):
+                name, value = statement
+                frames.append(rAssign(name, value))
+            elif trapErrors:
+                frames.append(rEval(self._trapExpr(statement, void)))
+            else:
+                frames.append(rEval(statement, void=void))
+
+        results = []
+        errors = []
+        start = 0
+        try:
+            while start < len(frames):
+                # send a window of statements (at least one), then read
+                # their responses:
+                end, size = start + 1, len(frames[start])
+                while end < len(frames) and \
+                        size + len(frames[end]) <= BATCH_WINDOW_SIZE:
+                    size += len(frames[end])
+                    end += 1
+                self.sock.sendall(b''.join(frames[start:end]))
+                for idx in range(start, end):
+                    results.append(self._evalManyResult(
+                        idx, statements[idx], trapErrors, atomicArray,
+                        errors))
+                start = end
+        except BaseException:
+            # The responses of the remaining statements are still pending,
+            # so the data stream can't be used anymore:
+            self.poisoned = True
+            self._close()
+            raise
+        if errors:
+            if not trapErrors:
+                self._fetchLastErrorMessage(errors)
+            idx, statement, error = errors[0]
+            raise RBatchEvalError('Statement %d (%r) failed: %s' %
+                                  (idx, statement, error), errors, results)
+        return results
+
+    def _evalManyResult(self, idx, statement, trapErrors, atomicArray,
+                        errors):
+        """
+        Read the response to a statement sent by evalMany() and return its
+        result. Errors raised by R are appended to 'errors'.
+        """
+        try:
+            result = self._parseResponse(self._reader, atomicArray)
+            if trapErrors and not isinstance(statement, tuple):
+                result = self._trappedResult(result)
+        except REvalError as exc:
+            errors.append((idx, statement, exc))
+            return None
+        return None if isinstance(statement, tuple) else result
+
+    def _fetchLastErrorMessage(self, errors):
+        """
+        Replace the last of the (untrapped) errors collected by
+        _evalManyResult() by one carrying R's error message. R only remembers
+        the message of the last error, the others keep a generic message.
+        """
+        lastErrorMsg = self._eval('geterrmessage()', trapErrors=False).strip()
+        idx, statement, error = errors[-1]
+        errors[-1] = (idx, statement, REvalError(lastErrorMsg))
+
     @checkIfClosed
     def voidEval(self, aString):
         """
@@ -214,20 +768,26 @@ class RConnector(object):
 #        return self.receive()
 
     @checkIfClosed
-    def setRexp(self, name, o):
+    def setRexp(self, name, o, deadline=None):
         """
         Convert a python object into an RExp and bind it to a variable
-        called "name" in the R namespace
+        called "name" in the R namespace. 'deadline' limits the time the
+        assignment may take (see deadline()).
         """
+        if deadline is not None:
+            with self.deadline(deadline):
+                return self.setRexp(name, o)
         rAssign(name, o, self.sock)
         # Rserv sends an emtpy confirmation message, or error message in case
         # of an error. rparse() will raise an Exception in the latter case.
-        rparse(self.sock, atomicArray=self.atomicArray)
+        rparse(self._reader, atomicArray=self.atomicArray)
+        if self.cacheNames:
+            self._nameCache[name] = NAME_VARIABLE
 
     @checkIfClosed
     def getRexp(self, name):
         """Retrieve a Rexp stored in a variable called 'name'"""
-        return self.eval(name)
+        return self._eval(name)
 
     @checkIfClosed
     def callFunc(self, name, *args, **kw):
@@ -249,6 +809,12 @@ class RConnector(object):
             assert [x for x in args if not isinstance(x, RBaseProxy)] == (),\
                 'Only references to variables or functions allowed for "rm()"'
 
+        if self.packCallArgs and \
+                [v for v in args + tuple(kw.values())
+                 if not isinstance(v, RBaseProxy)]:
+            return self._callFuncPacked(name, args, kw)
+        self._clearMissingNames()
+
         argNames = []
         for idx, arg in enumerate(args):
             if isinstance(arg, RBaseProxy):
@@ -267,7 +833,66 @@ class RConnector(object):
                 argName = 'kwarg_%s_' % key
                 self.setRexp(argName, value)
             argNames.append('%s=%s' % (key, argName))
-        return self.eval(name+'(%s)' % ', '.join(argNames))
+        return self._eval(name+'(%s)' % ', '.join(argNames))
+
+    def _callFuncPacked(self, name, args, kw):
+        """
+        Make a call to a function "name" with all argument values packed into
+        one tagged list. The list is assigned and handed to the function via
+        do.call() within one network round-trip, and removed afterwards.
+        Proxies are passed by their names, their list items are filled in on
+        the R side.
+        """
+        argList = TaggedList()
+        proxyIdxs = []
+        proxyNames = []
+        for key, value in [(None, arg) for arg in args] + list(kw.items()):
+            if isinstance(value, RBaseProxy):
+                proxyIdxs.append('%dL' % (len(argList) + 1))
+                proxyNames.append(value.__name__)
+                value = None
+            if key is None:
+                argList.append(value)
+            else:
+                argList.append(**{key: value})
+        setProxies = ''
+        if proxyNames:
+            setProxies = '.args[c(%s)] <- list(%s); ' % \
+                         (', '.join(proxyIdxs), ', '.join(proxyNames))
+        # The function is called from the global environment like in the
+        # unpacked case (e.g. for functions using parent.frame()). It is
+        # passed by name, so that calls reported with errors don't contain
+        # its entire definition:
+        expr = 'local({.args <- %s; rm(%s, envir=globalenv()); %s' \
+               'do.call(%s, .args, envir=globalenv())})' % \
+               (CALL_ARGS_NAME, CALL_ARGS_NAME, setProxies, rQuote(name))
+        self._clearMissingNames()
+        trapErrors = self.trapErrors
+        statements = [(CALL_ARGS_NAME, argList), expr]
+        errors = []
+        # The argument list is streamed like in setRexp(), the call is sent
+        # right after it, so both only cost one round-trip. The call is the
+        # last message sent, so it may safely use OOB messages (see
+        # evalMany()):
+        rAssign(CALL_ARGS_NAME, argList, self.sock)
+        try:
+            self._reval(self._trapExpr(expr, False) if trapErrors else expr,
+                        void=False)
+            results = [self._evalManyResult(idx, statement, trapErrors,
+                                            self.atomicArray, errors)
+                       for idx, statement in enumerate(statements)]
+        except BaseException:
+            # The response to the call might still be pending, so the data
+            # stream can't be used anymore:
+            self.poisoned = True
+            self._close()
+            raise
+        if errors:
+            if not trapErrors:
+                self._fetchLastErrorMessage(errors)
+            # report the error of the function call itself:
+            raise errors[-1][2]
+        return results[1]
 
     @checkIfClosed
     def assign(self, aDict):
@@ -278,7 +903,307 @@ class RConnector(object):
     @checkIfClosed
     def isFunction(self, name):
         """Check whether given name references an existing function in R"""
-        return self.eval('is.function(%s)' % name)
+        return self._eval('is.function(%s)' % name)
+
+    @checkIfClosed
+    def lookupName(self, name):
+        """
+        Return NAME_FUNCTION or NAME_VARIABLE depending on what 'name'
+        references in R, or None if no such object exists. If name caching is
+        enabled the result is taken from (or stored in) the name cache.
+        """
+        if self.cacheNames and name in self._nameCache:
+            return self._nameCache[name]
+        try:
+            kind = NAME_FUNCTION if self.isFunction(name) else NAME_VARIABLE
+        except (REvalError, RResponseError):
+            # an error is only raised if neither such a function or variable
+            # exists at all!
+            kind = None
+        if self.cacheNames:
+            self._nameCache[name] = kind
+        return kind
+
+    @checkIfClosed
+    def refreshNameCache(self):
+        """
+        Fill the name cache with all names visible from R's global
+        environment (i.e. all objects in the environments on R's search path)
+        in one go.
+        """
+        names, isFunction = self._eval(R_LIST_NAMES, atomicArray=True,
+                                       trapErrors=False)
+        self._nameCache.clear()
+        self._helpCache.clear()
+        for name, isFunc in zip(names, isFunction):
+            self._nameCache[name] = NAME_FUNCTION if isFunc else NAME_VARIABLE
+
+    def _clearMissingNames(self):
+        """
+        Function calls might create new objects in R, so names which have not
+        been found before have to be looked up again
+        """
+        for name in [n for n, kind in self._nameCache.items() if kind is None]:
+            del self._nameCache[name]
+
+    @checkIfClosed
+    def open(self, name, mode='rb', bufferSize=FILE_BUFFER_SIZE):
+        """
+        Open a file on the host Rserve is running on, either for reading
+        (mode 'rb') or for writing (mode 'wb', existing files are truncated).
+        Relative file names are resolved against Rserve's working directory.
+        Returns a file-like object which transfers data in chunks of at most
+        'bufferSize' bytes. Only one file can be open per connection.
+        """
+        if mode not in ('r', 'rb', 'w', 'wb'):
+            raise ValueError("Invalid mode '%s', only binary reading ('rb') "
+                             "or writing ('wb') is supported" % mode)
+        # make sure that Rserve can send data chunks of the requested size:
+        rSetBufferSize(bufferSize, fp=self.sock)
+        rparse(self._reader)
+        if mode.startswith('r'):
+            rOpenFile(name, fp=self.sock)
+        else:
+            rCreateFile(name, fp=self.sock)
+        rparse(self._reader)
+        return RFile(self, name, mode[0] + 'b', bufferSize)
+
+    @checkIfClosed
+    def removeFile(self, name):
+        """Remove a file on the host Rserve is running on"""
+        rRemoveFile(name, fp=self.sock)
+        rparse(self._reader)
+
+    @checkIfClosed
+    def _readFile(self, size):
+        rReadFile(size, fp=self.sock)
+        return rparseRaw(self._reader)
+
+    @checkIfClosed
+    def _writeFile(self, data):
+        rWriteFile(data, fp=self.sock)
+        rparse(self._reader)
+
+    @checkIfClosed
+    def _closeFile(self):
+        rCloseFile(fp=self.sock)
+        rparse(self._reader)
+
+
+class RConnectorPool(object):
+    """
+    Thread-safe pool of RConnector instances. Every connection is only handed
+    out to one caller at a time. Idle connections are checked before they are
+    handed out again, dead ones are replaced by fresh connections.
+    """
+    def __init__(self, host, port, size, init=None, **connectArgs):
+        if size < 1:
+            raise ValueError('Size of connection pool must be at least 1')
+        self.host = host
+        self.port = port
+        self.size = size
+        self.init = init
+        self.connectArgs = connectArgs
+        # Every slot of the pool is either an idle connection or None (if its
+        # connection has been discarded and needs to be re-created):
+        self._idle = queue.LifoQueue()
+        self.__closed = False
+        # Open all connections right away so that warm R sessions are
+        # available as soon as the pool has been created:
+        for _ in range(size):
+            self._idle.put(self._newConnection())
+
+    def __repr__(self):
+        txt = 'Closed pool' if self.isClosed else 'Pool'
+        unixSocket = self.connectArgs.get('unixSocket')
+        if unixSocket:
+            return '<%s of %d handles to Rserve on unix socket %s>' % \
+                   (txt, self.size, unixSocket)
+        return '<%s of %d handles to Rserve on %s:%s>' % \
+               (txt, self.size, self.host or 'localhost', self.port)
+
+    @property
+    def isClosed(self):
+        return self.__closed
+
+    def _newConnection(self):
+        conn = connect(self.host, self.port, **self.connectArgs)
+        if self.init is not None:
+            try:
+                if callable(self.init):
+                    self.init(conn)
+                else:
+                    conn.voidEval(self.init)
+            except:
+                self._discard(conn)
+                raise
+        return conn
+
+    @staticmethod
+    def _discard(conn):
+        if not conn.isClosed:
+            try:
+                conn.close()
+            except (PyRserveClosed, socket.error):
+                pass
+
+    @staticmethod
+    def _isHealthy(conn):
+        """
+        Check an idle connection without sending anything to Rserve: an idle
+        socket must not have any data to read. If it has, Rserve has either
+        closed the connection or the stream is out of sync.
+        """
+        if conn.isClosed or conn._reader.buffered:
+            return False
+        try:
+            readable = select.select([conn.sock], [], [], 0)[0]
+        except (select.error, socket.error, ValueError):
+            return False
+        return not readable
+
+    def acquire(self, timeout=None):
+        """
+        Obtain a connection from the pool. Blocks until a connection becomes
+        available, or raises RPoolExhausted after 'timeout' seconds.
+        """
+        if self.isClosed:
+            raise PyRserveClosed('Connection pool already closed')
+        try:
+            conn = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise RPoolExhausted('No connection available in pool after '
+                                 'waiting %s seconds' % timeout)
+        if conn is None or not self._isHealthy(conn):
+            # Either a placeholder for a connection discarded earlier, or
+            # a dead connection. Replace it by a new one:
+            if conn is not None:
+                self._discard(conn)
+            try:
+                conn = self._newConnection()
+            except:
+                # keep the slot so that a later acquire() can retry:
+                self._idle.put(None)
+                raise
+        return conn
+
+    def release(self, conn):
+        """Hand a connection obtained via acquire() back to the pool"""
+        if self.isClosed or conn.isClosed:
+            self._discard(conn)
+            if not self.isClosed:
+                # make sure a new connection is created on next acquire()
+                self._idle.put(None)
+        else:
+            self._idle.put(conn)
+
+    @contextlib.contextmanager
+    def connection(self, timeout=None):
+        """
+        Context manager acquiring a connection from the pool and releasing it
+        when leaving the `with` block
+        """
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """
+        Close all idle connections. Connections currently in use are closed
+        when they are released.
+        """
+        self.__closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if conn is not None:
+                self._discard(conn)
+
+
+class RFile(io.RawIOBase):
+    """
+    File-like object for streaming a file from or to the host Rserve is
+    running on. Data is transferred in chunks of at most 'bufferSize' bytes,
+    so files of any size can be moved with constant memory.
+    Instances should be created via RConnector.open().
+    """
+    def __init__(self, conn, name, mode, bufferSize):
+        io.RawIOBase.__init__(self)
+        self.name = name
+        self.mode = mode
+        self.bufferSize = bufferSize
+        self._conn = conn
+
+    def __repr__(self):
+        return '<RFile %r, mode %r on %r>' % (self.name, self.mode, self._conn)
+
+    def readable(self):
+        return self.mode == 'rb'
+
+    def writable(self):
+        return self.mode == 'wb'
+
+    def _checkMode(self, mode):
+        if self.closed:
+            raise ValueError('I/O operation on closed file')
+        if self.mode != mode:
+            raise io.UnsupportedOperation('File not open for %s' %
+                                          ('reading' if mode == 'rb'
+                                           else 'writing'))
+
+    def read(self, size=-1):
+        """
+        Read up to 'size' bytes (at most one chunk of 'bufferSize' bytes) from
+        the file. If 'size' is omitted or negative all remaining data is read.
+        """
+        if size is None or size < 0:
+            return self.readall()
+        self._checkMode('rb')
+        if size == 0:
+            return b''
+        return self._conn._readFile(min(size, self.bufferSize))
+
+    def readall(self):
+        chunks = []
+        while True:
+            chunk = self.read(self.bufferSize)
+            if not chunk:
+                return b''.join(chunks)
+            chunks.append(chunk)
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def write(self, b):
+        """Write the given bytes to the file, split into chunks if needed"""
+        self._checkMode('wb')
+        data = memoryview(b)
+        for pos in range(0, len(data), self.bufferSize):
+            self._conn._writeFile(data[pos:pos + self.bufferSize].tobytes())
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            try:
+                if not self._conn.isClosed:
+                    self._conn._closeFile()
+            finally:
+                io.RawIOBase.close(self)
+
+    def __del__(self):
+        # Unlike close() this must not talk to Rserve, the garbage collector
+        # might run in the middle of another request on the connection. The
+        # file remains open in Rserve until the next open() closes it.
+        if not self.closed:
+            if PY3:
+                warnings.warn('unclosed %r' % self, ResourceWarning)
+            io.RawIOBase.close(self)
 
 
 class RNameSpace(object):
@@ -299,14 +1224,11 @@ class RNameSpace(object):
         to function called 'name'
         """
         realname = name[1:] if name.startswith('_') else name
-        try:
-            isFunction = self._rconn.isFunction(realname)
-        except:
-            # an error is only raised if neither such a function or variable
-            # exists at all!
+        kind = self._rconn.lookupName(realname)
+        if kind is None:
             raise NameError('no such variable or function "%s" '
                             'defined in Rserve' % realname)
-        if isFunction:
+        if kind == NAME_FUNCTION:
             return RFuncProxy(realname, self._rconn)
         elif name.startswith('_'):
             return RVarProxy(realname, self._rconn)
@@ -328,14 +1250,11 @@ class RNameSpaceReference(object):
 
     def __getattr__(self, name):
         """Return either a reference proxy to a variable to to a function"""
-        try:
-            isFunction = self._rconn.isFunction(name)
-        except:
-            # an error is only raised if neither such a function or variable
-            # exists at all!
+        kind = self._rconn.lookupName(name)
+        if kind is None:
             raise NameError('no such variable or function "%s" '
                             'defined in Rserve' % name)
-        if isFunction:
+        if kind == NAME_FUNCTION:
             return RFuncProxy(name, self._rconn)
         else:
             return RVarProxy(name, self._rconn)
@@ -391,16 +1310,22 @@ class RFuncProxy(RBaseProxy):
         Everything in one line and better (doesn't need to know the pkg):
         a <- capture.output(tools:::Rd2txt(utils:::.getHelpFile(help(sapply))))
         """
+        helpCache = self._rconn._helpCache
+        if self._rconn.cacheNames and self.__name__ in helpCache:
+            return helpCache[self.__name__]
         try:
-            d = self._rconn.eval(self.R_HELP % self.__name__)
+            d = self._rconn._eval(self.R_HELP % self.__name__)
         except REvalError:
             # probably no help available, unfortunately there is no specific
             # code for this...
-            return None
-        # Join the list of strings:
-        helpstring = '\n'.join(d)
-        # remove some obscure characters:
-        # helpstring = helpstring.replace('_\x08', '')
+            helpstring = None
+        else:
+            # Join the list of strings:
+            helpstring = '\n'.join(d)
+            # remove some obscure characters:
+            # helpstring = helpstring.replace('_\x08', '')
+        if self._rconn.cacheNames:
+            helpCache[self.__name__] = helpstring
         return helpstring
 
     def help(self):
@@ -415,11 +1340,7 @@ class RFuncProxy(RBaseProxy):
             return self.__name__
 
         concatName = "%s.%s" % (self.__name__, name)
-        try:
-            self._rconn.isFunction(concatName)
-        except:
-            # an error is only raised if neither such a function or variable
-            # exists at all!
+        if self._rconn.lookupName(concatName) is None:
             raise NameError('no such variable or function "%s" '
                             'defined in R' % concatName)
         return RFuncProxy(concatName, self._rconn)
@@ -8,8 +8,29 @@ class PyRserveError(Exception):
 
 
 class REvalError(PyRserveError):
-    """Indicates an error raised by R itself (not by Rserve)"""
-    pass
+    """
+    Indicates an error raised by R itself (not by Rserve)
+    - call:    the R call which raised the error, if known
+    - classes: the classes of the R condition object, if known
+    """
+    def __init__(self, message, call=None, classes=None):
+        PyRserveError.__init__(self, message)
+        self.call = call
+        self.classes = classes
+
+
+class RBatchEvalError(REvalError):
+    """
+    Indicates that R raised errors for statements sent via evalMany().
+    - errors:  list of (index, statement, REvalError) of all failed statements.
+               Without trapErrors R only provides the message of the last
+               error, the other errors just carry a generic message.
+    - results: results of all statements, None for the failed ones
+    """
+    def __init__(self, message, errors, results):
+        REvalError.__init__(self, message)
+        self.errors = errors
+        self.results = results
 
 
 class RConnectionRefused(PyRserveError):
@@ -26,3 +47,20 @@ class RSerializationError(PyRserveError):
 
 class PyRserveClosed(PyRserveError):
     pass
+
+
+class PyRserveTimeout(PyRserveError):
+    """
+    Indicates that Rserve did not respond in time. The connection is
+    closed then, since the state of the data stream is unknown.
+    """
+    pass
+
+
+class RPoolExhausted(PyRserveError):
+    pass
+
+
+class RWarning(UserWarning):
+    """Category of Python warnings issued for warnings raised by R"""
+    pass
@@ -2,16 +2,37 @@
 """
 Parser module for pyRserve
 """
+import functools
+import os
 import struct
 import socket
-import io
+import tempfile
+###
+from numpy.lib.format import open_memmap
+try:
+    import pandas
+except ImportError:
+    # pandas is only needed for returning data.frames as DataFrames
+    pandas = None
 ###
 from .rtypes import *
-from .misc import FunctionMapper, byteEncode, stringEncode, PY3
+from .misc import FunctionMapper, byteEncode, stringEncode, PY3, \
+    monotonic
 from .rexceptions import RResponseError, REvalError
-from .taggedContainers import TaggedList, asTaggedArray, asAttrArray
+from .taggedContainers import TaggedList, LazyTaggedList, AttrArray, \
+    Factor, asTaggedArray, asAttrArray, asFactor
 
 DEBUG = 0
+CLEAR_CHUNK_SIZE = 1024 * 1024
+READ_BUFFER_SIZE = 16 * SOCKET_BLOCK_SIZE
+# numeric arrays of at least this number of bytes are written to a
+# memory-mapped file if a spill directory is given:
+SPILL_THRESHOLD = 64 * 1024 * 1024
+# NA handling modes: by default missing values remain in the data as they
+# are sent by R (NA_integer_, NA_real_, and 2 for logical vectors), NA strings
+# become None. With NA_MASK these arrays are returned as numpy masked arrays:
+NA_MODES = (None, 'mask')
+NA_MASK = 'mask'
 
 
 class OOBMessage(object):
@@ -95,6 +116,61 @@ class EndOfDataError(RserveError):
     pass
 
 
+class SocketReader(object):
+    """
+    Buffered reader for a socket, meant to be kept for the lifetime of a
+    connection and passed to rparse() instead of the socket itself.
+
+    Data is received in blocks of 'bufferSize' bytes, so that small reads
+    (like message headers, or entire small messages) are served from memory
+    instead of requiring a recv() system call each. Data which belongs to
+    a following message stays buffered for the next read. Large reads are
+    received directly into the target buffer.
+    """
+    def __init__(self, sock, bufferSize=READ_BUFFER_SIZE):
+        self.sock = sock
+        self._block = memoryview(bytearray(bufferSize))
+        self._buffer = self._block[:0]
+        self._bufferPos = 0
+        # number of recv() system calls made, for benchmarking:
+        self.recvCalls = 0
+        # point in time (see misc.monotonic()) by which all data has to be
+        # received, every recv() may only block for the time remaining:
+        self.deadline = None
+
+    @property
+    def buffered(self):
+        """Number of bytes received from the socket but not read yet"""
+        return len(self._buffer) - self._bufferPos
+
+    def _recvInto(self, view):
+        if self.deadline is not None:
+            remaining = self.deadline - monotonic()
+            if remaining <= 0:
+                raise socket.timeout('Deadline exceeded')
+            self.sock.settimeout(remaining)
+        self.recvCalls += 1
+        return self.sock.recv_into(view)
+
+    def readinto(self, view):
+        """
+        Read data into the memoryview 'view', like socket.recv_into() does.
+        Returns the number of bytes read, 0 if the connection has been closed.
+        """
+        pos = self._bufferPos
+        if pos == len(self._buffer):
+            if len(view) >= len(self._block):
+                # no point in buffering, avoid copying the data around:
+                return self._recvInto(view)
+            # The buffer can be reused, since data is always copied out of it
+            self._buffer = self._block[:self._recvInto(self._block)]
+            pos = 0
+        numBytes = min(len(view), len(self._buffer) - pos)
+        view[:numBytes] = self._buffer[pos:pos + numBytes]
+        self._bufferPos = pos + numBytes
+        return numBytes
+
+
 class Lexer(object):
     """Rserve message lexer
     Can either read a OOBMessage or a R Object
@@ -102,24 +178,36 @@ class Lexer(object):
     lexerMap = {}
     fmap = FunctionMapper(lexerMap)
 
-    def __init__(self, src):
+    def __init__(self, src, spillDir=None, spillThreshold=SPILL_THRESHOLD):
         """
-        @param src: Either a string, a file object, a socket -
-                    all providing valid binary r data
+        @param src: Either a string, a file object, a socket or a
+                    SocketReader - all providing valid binary r data
+        @param spillDir: directory in which numeric arrays of at least
+                    'spillThreshold' bytes are stored as .npy files, they
+                    are returned as numpy.memmap then
         """
+        self.spillDir = spillDir
+        self.spillThreshold = spillThreshold
         if type(src) == str:
-            # this only works for objects implementing the buffer protocol,
-            # e.g. strings, arrays, ...
             # convert string to byte object
-            self.fp = io.BytesIO(byteEncode(src))
-        elif type(src) == bytes:
-            self.fp = io.BytesIO(src)
+            src = byteEncode(src)
+        if isinstance(src, (bytes, bytearray, memoryview)):
+            # all data is already in memory, so just read from it directly.
+            # Arrays parsed from immutable bytes are copied to keep them
+            # writable, data from a bytearray is used without copying.
+            self.fp = None
+            self._buffer = memoryview(src)
         else:
             self.fp = src
-        if isinstance(self.fp, socket.socket):
-            self._read = self.fp.recv
-        else:
-            self._read = self.fp.read
+            self._buffer = memoryview(b'')
+            if isinstance(self.fp, socket.socket):
+                self._readInto = self.fp.recv_into
+            elif hasattr(self.fp, 'readinto'):
+                self._readInto = self.fp.readinto
+            else:
+                self._readInto = self.__readIntoFromRead
+        # position of the next unread byte in self._buffer:
+        self._bufferPos = 0
         # The following attributes will be set thru 'readHeader()':
         self.lexpos = None
         self.messageSize = None
@@ -145,14 +233,13 @@ class Lexer(object):
         """
         self.lexpos = 0
 
-        command = Command(struct.unpack('<I', self.read(4))[0])
-        # Obtain lower 32bit part of message length:
-        messageSize1 = self.__unpack(XT_INT)
-        dataOffset = self.__unpack(XT_INT)
+        # read the entire header at once:
+        code, messageSize1, dataOffset, messageSize2 = \
+            struct.unpack('<IIII', self.read(RHEADER_SIZE))
+        command = Command(code)
         assert dataOffset == 0, 'dataOffset > 0 is not implemented'
-        # Obtain upper 32bit part of message length:
-        messageSize2 = self.__unpack(XT_INT) << 32  # shift 32bits to the left
-        self.messageSize = messageSize2 + messageSize1
+        # Combine upper and lower 32bit parts of message length:
+        self.messageSize = (messageSize2 << 32) + messageSize1
 
         self.isOOB = command.isOOB
         if self.isOOB:
@@ -183,51 +270,118 @@ class Lexer(object):
                       (self.responseOK, self.responseCode,
                        self.errCode, self.messageSize))
 
+        if self.fp is not None and self._bufferPos == len(self._buffer) \
+                and self.spillDir is None:
+            # Receive the entire data part of the message at once, so that
+            # all further reads (and especially numeric arrays) are served
+            # from this buffer without copying data around. This is not done
+            # if large arrays should be spilled to disk, since the message
+            # might not fit into memory then:
+            self._buffer = self._receive(self.messageSize)
+            self._bufferPos = 0
         return self.messageSize
 
     def clearSocketData(self):
         """
         If for any reason the parsing process returns an error, make sure that
-        all data from a socket is removed to avoid data pollution with further
-        parsing attempts.
+        the rest of the current message is consumed from the input source to
+        avoid data pollution with further parsing attempts. The size of the
+        message is known from its header, so exactly the remaining bytes are
+        read - any data following the message (e.g. responses to pipelined
+        requests) is left untouched.
         """
-        if not isinstance(self.fp, socket.socket):
-            # not a socket. Nothing to do here.
+        if self.messageSize is None:
+            # header has not been read yet, so nothing to clear
             return
-        # Switch socket into non-blocking mode and read from it until it
-        # is empty (and hence socket.error is raised):
-        self.fp.setblocking(False)
+        remaining = self.messageSize + RHEADER_SIZE - self.lexpos
         try:
-            while True:
-                self.fp.recv(SOCKET_BLOCK_SIZE)
-        except socket.error:
-            # socket has no more data, it can be considered as cleared
+            while remaining > 0:
+                # read in chunks to keep memory consumption low:
+                chunkSize = min(remaining, CLEAR_CHUNK_SIZE)
+                self.read(chunkSize)
+                remaining -= chunkSize
+        except (EndOfDataError, socket.error):
+            # connection has been closed, there is nothing left to clear
             pass
-        finally:
-            # Now set it back to blocking mode (no matter what exception):
-            self.fp.setblocking(True)
 
-    def read(self, length):
+    def __readIntoFromRead(self, view):
+        """readinto() for input sources only providing a read() method"""
+        data = self.fp.read(len(view))
+        view[:len(data)] = data
+        return len(data)
+
+    def _receive(self, length, view=None):
         """
-        Read number of bytes from input data source (file or socket).
+        Read 'length' bytes from the input source (file or socket) into a
+        newly allocated buffer, or into the given memoryview 'view'.
+        Sockets might not return all requested data at once, so data is
+        received in a loop until the buffer is filled.
         If end of data is reached it raises EndOfDataError().
-
-        Sockets might not return all requested data at once, so use an io
-        buffer to collect all data needed in a loop.
         """
-        bytesToRead = length
-        buf = io.BytesIO(b'')
-        while bytesToRead > 0:
-            fragment = self._read(bytesToRead)
-            lenFrag = len(fragment)
-            if lenFrag == 0:
+        if view is None:
+            view = memoryview(bytearray(length))
+        pos = 0
+        while pos < length:
+            numBytes = self._readInto(view[pos:]) if self.fp else 0
+            if not numBytes:
                 raise EndOfDataError()
-            buf.write(fragment)
-            bytesToRead -= lenFrag
+            pos += numBytes
+        return view
 
+    def readView(self, length):
+        """
+        Read number of bytes from input data source and return them as a
+        memoryview. Data of the current message is returned without being
+        copied.
+        If end of data is reached it raises EndOfDataError().
+        """
+        available = len(self._buffer) - self._bufferPos
+        if length <= available:
+            view = self._buffer[self._bufferPos:self._bufferPos + length]
+            self._bufferPos += length
+        else:
+            # data is not (or only partially) buffered, e.g. the header of
+            # the next message:
+            view = memoryview(bytearray(length))
+            view[:available] = self._buffer[self._bufferPos:]
+            self._receive(length - available, view[available:])
+            self._buffer = memoryview(b'')
+            self._bufferPos = 0
         self.lexpos += length
-        data = buf.getvalue()
-        return data
+        return view
+
+    def readExprView(self):
+        """
+        Skip the next REXPR (including its attributes) by only evaluating
+        its header, and return its entire binary data as a memoryview into
+        the buffer of the current message, for parsing it later on.
+        """
+        start = self._bufferPos
+        lexeme = self.nextExprHdr()
+        self.readView(lexeme.length)
+        return self._buffer[start:self._bufferPos]
+
+    def readInto(self, view):
+        """
+        Fill the (writable) memoryview 'view' with data from the input
+        source, large amounts of data are received into it directly.
+        If end of data is reached it raises EndOfDataError().
+        """
+        length = len(view)
+        available = min(len(self._buffer) - self._bufferPos, length)
+        view[:available] = \
+            self._buffer[self._bufferPos:self._bufferPos + available]
+        self._bufferPos += available
+        if available < length:
+            self._receive(length - available, view[available:])
+        self.lexpos += length
+
+    def read(self, length):
+        """
+        Read number of bytes from input data source (file or socket).
+        If end of data is reached it raises EndOfDataError().
+        """
+        return self.readView(length).tobytes()
 
     def __unpack(self, tCode, num=None):
         """
@@ -251,30 +405,32 @@ class Lexer(object):
         d = struct.unpack(fmt, rawData)
         return d[0] if num is None else list(d)
 
-    def nextExprHdr(self):
+    def nextExprHdr(self, validTypes=VALID_R_TYPES):
         """
         From the input file/socket determine the type of the next data item,
         and its length.
         This method can be applied to read the
-        - entire data header (containing one of the DT_* codes)
+        - entire data header (containing one of the DT_* codes, in this case
+          provide validTypes=VALID_DT_TYPES)
         - an REXPR header
         """
         startLexpos = self.lexpos
-        _rTypeCode = self.__unpack('B')  # unsigned byte!
+        # read type code (1 byte) and length (3 bytes) at once:
+        header = struct.unpack('<I', self.read(4))[0]
+        _rTypeCode = header & 0xFF
         # extract pure rTypeCode without XT_HAS_ATTR or XT_LARGE flags:
         rTypeCode = _rTypeCode & 0x3F
         # extract XT_HAS_ATTR flag (if it exists)"
         hasAttr = (_rTypeCode & XT_HAS_ATTR) != 0
         # extract XT_LARGE flag (if it exists):
         isXtLarge = (_rTypeCode & XT_LARGE) != 0
+        # small header, use 3 bytes for length information:
+        length = header >> 8
         if isXtLarge:
             # header is larger, use all 7 bytes for length information
             # (new in Rserve 0.3)
-            length = self.__unpack(XT_INT7)
-        else:
-            # small header, use 3 bytes for length information
-            length = self.__unpack(XT_INT3)
-        if rTypeCode not in VALID_R_TYPES:
+            length += struct.unpack('<I', self.read(4))[0] << 24
+        if rTypeCode not in validTypes:
             raise RParserError(
                 "Unknown SEXP type %s found at lexpos %d, length %d" %
                 (hex(rTypeCode), startLexpos, length))
@@ -311,9 +467,31 @@ class Lexer(object):
 
     @fmap(XT_ARRAY_INT, XT_ARRAY_DOUBLE, XT_ARRAY_CPLX)
     def xt_array_numeric(self, lexeme):
-        raw = self.read(lexeme.dataLength)
+        if self.spillDir is not None and \
+                lexeme.dataLength >= self.spillThreshold:
+            return self._spillArray(lexeme)
+        raw = self.readView(lexeme.dataLength)
         # TODO: swapping...
-        data = numpy.fromstring(raw, dtype=numpyMap[lexeme.rTypeCode])
+        # The array is created as a view onto the received message, no data
+        # is copied:
+        data = numpy.frombuffer(raw, dtype=numpyMap[lexeme.rTypeCode])
+        return data.copy() if raw.readonly else data
+
+    def _spillArray(self, lexeme):
+        """
+        Write the data of a numeric array into a new .npy file in the spill
+        directory and return it as a numpy.memmap. The data is received
+        directly into the mapped file, so the array never needs to fit into
+        memory. The file is not removed afterwards (see memmap.filename).
+        """
+        dtype = numpy.dtype(numpyMap[lexeme.rTypeCode])
+        fd, fileName = tempfile.mkstemp(suffix='.npy', prefix='pyRserve-',
+                                        dir=self.spillDir)
+        os.close(fd)
+        data = open_memmap(fileName, mode='w+', dtype=dtype,
+                           shape=(lexeme.dataLength // dtype.itemsize,))
+        self.readInto(memoryview(data.view(numpy.uint8)))
+        data.flush()
         return data
 
     @fmap(XT_ARRAY_BOOL)
@@ -331,10 +509,10 @@ class Lexer(object):
         """
         numBools = self.__unpack(XT_INT, 1)[0]
         # read the actual boolean values, including padding bytes:
-        raw = self.read(lexeme.dataLength - 4)
-        data = numpy.fromstring(raw[:numBools],
+        raw = self.readView(lexeme.dataLength - 4)
+        data = numpy.frombuffer(raw[:numBools],
                                 dtype=numpyMap[lexeme.rTypeCode])
-        return data
+        return data.copy() if raw.readonly else data
 
     @fmap(XT_ARRAY_STR)
     def xt_array_str(self, lexeme):
@@ -342,13 +520,14 @@ class Lexer(object):
         An array of one or more null-terminated strings.
         The XT_ARRAY_STR can contain trailing chars \x01 which need to be
         chopped off. Since strings are encoded as bytes (in Py3) they need
-        to be converted into real strings.
+        to be converted into real strings. NA strings become None.
         """
         if lexeme.dataLength == 0:
             return ''
         raw = self.read(lexeme.dataLength)
         bytesStrList = raw.split(b'\0')[:-1]
-        strList = [stringEncode(byteString) for byteString in bytesStrList]
+        strList = [None if byteString == STR_NA else stringEncode(byteString)
+                   for byteString in bytesStrList]
         return numpy.array(strList)
 
     @fmap(XT_STR, XT_SYMNAME)
@@ -382,16 +561,39 @@ class RParser(object):
     parserMap = {}
     fmap = FunctionMapper(parserMap)
 
-    def __init__(self, src, atomicArray):
+    def __init__(self, src, atomicArray, lazy=False, spillDir=None,
+                 spillThreshold=SPILL_THRESHOLD, dataFrames=False, na=None):
         """
         atomicArray: if False parsing arrays with only one element will just
                      return this element
         arrayOrder:  The order in which data in multi-dimensional arrays is
                      returned. 'C' for c-order, F for fortran.
+        lazy:        if True lists (vectors) are returned as LazyTaggedLists
+                     whose items are only parsed when accessed
+        spillDir:    directory for storing large numeric arrays as
+                     memory-mapped files (see Lexer)
+        dataFrames:  if True data.frames are returned as pandas DataFrames
+        na:          if 'mask' integer, double, logical and string arrays
+                     are returned as numpy.ma.MaskedArray with NA values
+                     masked
         """
-        self.lexer = Lexer(src)
+        if lazy and spillDir is not None:
+            # lazy parsing needs the entire message in memory
+            raise ValueError('lazy and spillDir cannot be used together')
+        if na not in NA_MODES:
+            raise ValueError('Unknown NA mode "%s", use one of %s' %
+                             (na, ', '.join(map(repr, NA_MODES))))
+        if dataFrames and pandas is None:
+            raise ImportError('pandas is required for returning data.frames '
+                              'as DataFrames')
+        self.lexer = Lexer(src, spillDir, spillThreshold)
         self.atomicArray = atomicArray
+        self.lazy = lazy
+        self.dataFrames = dataFrames
+        self.na = na
         self.indentLevel = None
+        # > 0 while attributes are parsed (those are never masked):
+        self.attrLevel = 0
 
     def __getitem__(self, key):
         return self.parserMap[key]
@@ -436,14 +638,7 @@ class RParser(object):
                 self.lexer.clearSocketData()
                 raise
         elif not self.lexer.responseOK:
-            try:
-                rserve_err_msg = ERRORS[self.lexer.errCode]
-            except KeyError:
-                raise REvalError("R evaluation error (code=%d)" %
-                                 self.lexer.errCode)
-            else:
-                raise RResponseError('Response error %s (error code=%d)' %
-                                     (rserve_err_msg, self.lexer.errCode))
+            self._raiseResponseError()
 
         if self.lexer.isOOB:
             return OOBMessage(self.lexer.oobType, self.lexer.oobUserCode,
@@ -451,12 +646,62 @@ class RParser(object):
         else:
             return message
 
+    def parseExpr(self):
+        """
+        Parse a single REXPR without any message or data header, as returned
+        by Lexer.readExprView()
+        """
+        self.indentLevel = 1
+        self.lexer.lexpos = 0
+        return self._postprocessData(self._parseExpr().data)
+
+    def parseRaw(self):
+        """
+        Read a response whose data part consists of plain bytes without any
+        data header (as sent by Rserve for CMD_readFile), and return them
+        """
+        self.lexer.readHeader()
+        if not self.lexer.responseOK:
+            self.lexer.clearSocketData()
+            self._raiseResponseError()
+        return self.lexer.read(self.lexer.messageSize)
+
+    def _raiseResponseError(self):
+        try:
+            rserve_err_msg = ERRORS[self.lexer.errCode]
+        except KeyError:
+            raise REvalError("R evaluation error (code=%d)" %
+                             self.lexer.errCode)
+        else:
+            raise RResponseError('Response error %s (error code=%d)' %
+                                 (rserve_err_msg, self.lexer.errCode))
+
     def _parse(self):
-        dataLexeme = self.lexer.nextExprHdr()
+        """
+        Parse the data part of a message. It usually consists of a single
+        parameter (e.g. a SEXP), which is returned. Some responses (like to
+        CMD_detachSession) contain several parameters which are returned in
+        a list then.
+        """
+        finalLexpos = self.lexer.lexpos + self.lexer.messageSize
+        params = []
+        while self.lexer.lexpos < finalLexpos:
+            params.append(self._parseParameter())
+        return params[0] if len(params) == 1 else params
+
+    def _parseParameter(self):
+        dataLexeme = self.lexer.nextExprHdr(validTypes=VALID_DT_TYPES)
         self._debugLog(dataLexeme, isRexpr=False)
         if dataLexeme.rTypeCode == DT_SEXP:
             lexeme = self._parseExpr()
             return self._postprocessData(lexeme.data)
+        elif dataLexeme.rTypeCode == DT_INT:
+            return struct.unpack('<i', self.lexer.read(4))[0]
+        elif dataLexeme.rTypeCode == DT_STRING:
+            raw = self.lexer.read(dataLexeme.length)
+            return stringEncode(raw.split(b'\0', 1)[0])
+        elif dataLexeme.rTypeCode == DT_BYTESTREAM:
+            return self.lexer.read(dataLexeme.length)
         else:
             raise NotImplementedError()
 
@@ -468,7 +713,11 @@ class RParser(object):
             self.indentLevel += 1
             if DEBUG:
                 print('%s Attribute:' % self.__ind)
-            lexeme.setAttr(self._parseExpr())
+            self.attrLevel += 1
+            try:
+                lexeme.setAttr(self._parseExpr())
+            finally:
+                self.attrLevel -= 1
             self.indentLevel -= 1
         lexeme.data = self.parserMap.get(lexeme.rTypeCode,
                                          self[None])(self, lexeme)
@@ -494,6 +743,13 @@ class RParser(object):
         Postprocess parsing results depending on configuration parameters
         Currently only arrays are effected.
         """
+        if data.__class__ == numpy.ma.MaskedArray and len(data) == 1 and \
+                not self.atomicArray:
+            # a single NA value becomes None, other values are handled like
+            # those of plain arrays below:
+            if numpy.ma.getmaskarray(data)[0]:
+                return None
+            data = data.data
         if data.__class__ == numpy.ndarray:
             # this does not apply for arrays with attributes
             # (__class__ would be TaggedArray)!
@@ -547,8 +803,44 @@ class RParser(object):
                         data.attr[tag] = value
                     except AttributeError:
                         data = asAttrArray(data, {tag: value})
+            if data.__class__ == AttrArray and 'levels' in data.attr and \
+                    data.dtype.kind == 'i' and 'factor' in \
+                    list(numpy.atleast_1d(data.attr.get('class', []))):
+                # a factor, its codes are kept as they are (no copying) and
+                # only expanded into strings on demand:
+                data = asFactor(data, data.attr)
+        if self.na == NA_MASK and not self.attrLevel and \
+                data.__class__ in (numpy.ndarray, numpy.memmap):
+            # arrays with attributes (like names) are not masked, neither are
+            # attribute values themselves (e.g. compact row.names c(NA, -n))
+            data = self._maskNA(data, lexeme.rTypeCode)
         return data
 
+    @staticmethod
+    def _maskNA(data, rTypeCode):
+        """
+        Return a masked array of data, in which R's NA values are masked.
+        The data itself is not copied.
+        """
+        if rTypeCode == XT_ARRAY_INT:
+            mask = data == INT_NA
+        elif rTypeCode == XT_ARRAY_DOUBLE:
+            # NA_real_ is a NaN (all exponent bits set) with a specific
+            # payload, other NaNs remain unmasked:
+            bits = data.view(numpy.uint64)
+            mask = ((bits & 0x7FF0000000000000) == 0x7FF0000000000000) & \
+                ((bits & 0xFFFFFFFF) == REAL_NA_LOW_WORD)
+        elif rTypeCode == XT_ARRAY_BOOL:
+            mask = data.view(numpy.uint8) == BOOL_NA
+        elif rTypeCode == XT_ARRAY_STR:
+            # NA strings have already been converted into None:
+            mask = numpy.vectorize(lambda item: item is None,
+                                   otypes=[bool])(data)
+        else:
+            return data
+        return numpy.ma.MaskedArray(data, mask=mask if mask.any()
+                                    else numpy.ma.nomask, copy=False)
+
     @fmap(XT_VECTOR, XT_VECTOR_EXP, XT_LANG_NOTAG, XT_LIST_NOTAG)
     def xt_vector(self, lexeme):
         """
@@ -570,6 +862,10 @@ class RParser(object):
             print('%s     Vector-lexpos: %d, length %d, finished at: %d' %
                   (self.__ind, self.lexer.lexpos,
                    lexeme.dataLength, finalLexpos))
+        if self.dataFrames and self._isDataFrame(lexeme):
+            return self._dataFrame(lexeme, finalLexpos)
+        if self.lazy:
+            return self._lazyVector(lexeme, finalLexpos)
         data = []
         while self.lexer.lexpos < finalLexpos:
             # convert single item arrays into atoms (via stripArray)
@@ -590,6 +886,98 @@ class RParser(object):
                               'not yet implemented' % tag)
         return data
 
+    def _lazyVector(self, lexeme, finalLexpos):
+        """
+        Only determine the positions of the items of a vector from their
+        headers, and return a LazyTaggedList which parses each item from the
+        buffer of the message when it is accessed for the first time.
+        In contrast to xt_vector() this also returns a (Lazy)TaggedList
+        for vectors without names.
+        """
+        views = []
+        while self.lexer.lexpos < finalLexpos:
+            views.append(self.lexer.readExprView())
+        keys = [None] * len(views)
+        if lexeme.hasAttr and lexeme.attrTypeCode == XT_LIST_TAG:
+            for tag, value in lexeme.attr:
+                if tag == 'names':
+                    keys = list(value)
+        return LazyTaggedList(keys, [functools.partial(self._parseLazy, view)
+                                     for view in views])
+
+    def _parseLazy(self, view):
+        return RParser(view, self.atomicArray, lazy=True,
+                       dataFrames=self.dataFrames, na=self.na).parseExpr()
+
+    @staticmethod
+    def _isDataFrame(lexeme):
+        if not (lexeme.hasAttr and lexeme.attrTypeCode == XT_LIST_TAG):
+            return False
+        for tag, value in lexeme.attr:
+            if tag == 'class':
+                return 'data.frame' in list(value)
+        return False
+
+    def _dataFrame(self, lexeme, finalLexpos):
+        """
+        Convert a data.frame into a pandas DataFrame. The columns are used
+        as they come from the parser, i.e. numeric columns remain views onto
+        the received message. Compact row names (c(NA, -nrow), as created by
+        R for data.frames without explicit row names) become a RangeIndex.
+        """
+        columns = []
+        while self.lexer.lexpos < finalLexpos:
+            # no postprocessing, columns with a single row remain arrays:
+            columns.append(self._parseExpr().data)
+        names, index = [], None
+        for tag, value in lexeme.attr:
+            if tag == 'names':
+                names = list(value)
+            elif tag == 'row.names':
+                if value.dtype.kind == 'i' and len(value) == 2 and \
+                        value[0] == INT_NA:
+                    index = pandas.RangeIndex(abs(int(value[1])))
+                else:
+                    index = pandas.Index(value)
+        if index is not None:
+            nrow = len(index)
+        else:
+            nrow = max([len(column) for column in columns
+                        if isinstance(column, numpy.ndarray)] or [0])
+        frame = pandas.DataFrame(
+            dict((idx, self._dataFrameColumn(column, nrow))
+                 for idx, column in enumerate(columns)),
+            index=index, copy=False)
+        frame.columns = names
+        return frame
+
+    @staticmethod
+    def _dataFrameColumn(column, nrow):
+        """Convert a parsed data.frame column into a pandas column"""
+        if isinstance(column, Factor):
+            # R's codes start at 1, NA becomes -1:
+            codes = numpy.where(column.codes == INT_NA, 0, column.codes) - 1
+            return pandas.Categorical.from_codes(codes, column.levels,
+                                                 ordered=column.ordered)
+        if isinstance(column, numpy.ndarray):
+            return column
+        if column is None or isinstance(column, str):
+            # string vectors without any items are parsed into ''
+            return numpy.array([], dtype=object)
+        # list columns (and nested data.frames, e.g. from tibbles) hold one
+        # item (or row) per row of the data.frame:
+        if isinstance(column, pandas.DataFrame):
+            items = [column.iloc[idx] for idx in range(len(column))]
+        else:
+            items = list(column)
+        if len(items) != nrow:
+            raise ValueError('data.frame column has %d items instead of %d' %
+                             (len(items), nrow))
+        result = numpy.empty(nrow, dtype=object)
+        for idx, item in enumerate(items):
+            result[idx] = item
+        return result
+
     @fmap(XT_LIST_TAG, XT_LANG_TAG)
     def xt_list_tag(self, lexeme):
         # a xt_list_tag usually occurs as an attribute of a vector or list
@@ -624,10 +1012,17 @@ class RParser(object):
 ##############################################################################
 
 
-def rparse(src, atomicArray=False):
-    rparser = RParser(src, atomicArray)
+def rparse(src, atomicArray=False, lazy=False, spillDir=None,
+           spillThreshold=SPILL_THRESHOLD, dataFrames=False, na=None):
+    rparser = RParser(src, atomicArray, lazy, spillDir, spillThreshold,
+                      dataFrames, na)
     return rparser.parse()
 
+
+def rparseRaw(src):
+    rparser = RParser(src, atomicArray=False)
+    return rparser.parseRaw()
+
 ##############################################################################
 
 
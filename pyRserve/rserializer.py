@@ -2,20 +2,26 @@
 Serializer class to convert Python objects into a binary data stream for
 sending them to Rserve.
 """
-__all__ = ['reval', 'rassign', 'rSerializeResponse', 'rShutdown']
+__all__ = ['reval', 'rassign', 'rSerializeResponse', 'rShutdown',
+           'rDetachSession', 'rDetachedVoidEval', 'rOpenFile', 'rCreateFile',
+           'rCloseFile', 'rReadFile', 'rWriteFile', 'rRemoveFile',
+           'rSetBufferSize']
 
 import struct
-import os
 import socket
-import io
 import sys
 import types
 ###
 import numpy
+try:
+    import pandas
+except ImportError:
+    # pandas is only needed for sending DataFrames and Categoricals
+    pandas = None
 ###
 from . import rtypes
 from .misc import PY3, FunctionMapper, byteEncode, padLen4, string2bytesPad4
-from .taggedContainers import TaggedList, TaggedArray
+from .taggedContainers import TaggedList, TaggedArray, Factor
 
 # turn on DEBUG to see extra information about what the serializer is
 # doing with your data
@@ -31,6 +37,65 @@ else:
     NoneType = types.NoneType
 
 
+# Chunks smaller than this are joined before being sent to a socket, larger
+# ones (i.e. array data) are sent directly from their own buffers:
+COALESCE_SIZE = 64 * 1024
+# Max. number of buffers passed to a single sendmsg() call (IOV_MAX is 1024
+# on most systems):
+SENDMSG_MAX_BUFFERS = 1024
+# When the size of a message is known in advance, its data is passed on to
+# the socket or file whenever this number of bytes has been collected:
+STREAM_BUFFER_SIZE = 1024 * 1024
+
+# keys of the serialization functions for objects sent as data.frame
+# (pandas DataFrames and structured numpy arrays) and as factor (Factors
+# and pandas Categoricals):
+DATA_FRAME = 'data.frame'
+FACTOR = 'factor'
+
+
+def _coalesceChunks(chunks):
+    """
+    Join consecutive small chunks into larger ones, and return a list of
+    memoryviews of all chunks
+    """
+    views = []
+    smallChunks = []
+    for chunk in chunks:
+        if len(chunk) < COALESCE_SIZE:
+            smallChunks.append(chunk)
+            continue
+        if smallChunks:
+            views.append(memoryview(b''.join(smallChunks)))
+            smallChunks = []
+        views.append(memoryview(chunk))
+    if smallChunks:
+        views.append(memoryview(b''.join(smallChunks)))
+    return views
+
+
+def _sendChunks(sock, chunks):
+    """
+    Send all chunks to a socket without joining them into one large buffer
+    first. Uses scatter-gather I/O (sendmsg) where it is available.
+    """
+    views = [view for view in _coalesceChunks(chunks) if len(view)]
+    if not hasattr(sock, 'sendmsg'):
+        for view in views:
+            sock.sendall(view)
+        return
+    idx = 0
+    while idx < len(views):
+        sent = sock.sendmsg(views[idx:idx + SENDMSG_MAX_BUFFERS])
+        # skip all buffers which have been sent completely, and continue
+        # with the rest of a partially sent one:
+        while idx < len(views) and sent >= len(views[idx]):
+            sent -= len(views[idx])
+            idx += 1
+        if sent:
+            views[idx] = views[idx][sent:]
+
+
 class RSerializer(object):
     """
     Class to to serialize Python objects into a binary data stream for sending
@@ -39,68 +104,154 @@ class RSerializer(object):
     Depending on 'commandType' given to __init__ the resulting binary string
     can be used to send a command, to assign a variable in Rserve, or to
     reply to a request received from Rserve.
+
+    The message is collected as a list of chunks: small byte strings for
+    headers and atomic values, and the buffers of numpy arrays. So array data
+    is not copied before it is sent (unless it needs to be converted into
+    Fortran order first).
+
+    The lengths of all data headers are computed in advance (see
+    _exprSize()), so every header is final when it is written. If the
+    message is created via serializeAll(), also the size of the entire
+    message is known from the beginning, and its data is passed on to the
+    socket or file while it is being serialized.
     """
     serializeMap = {}
     fmap = FunctionMapper(serializeMap)
+    # functions computing the length of the data block of an expression:
+    lengthMap = {}
+    lmap = FunctionMapper(lengthMap)
 
     def __init__(self, commandType, fp=None):
-        if isinstance(fp, socket.socket):
-            # kwargs = {'mode': 'b'} if PY3 else {}
-            self._fp = fp
-            self._buffer = io.BytesIO()
-        elif not fp:
-            self._buffer = fp or io.BytesIO()
-            self._fp = None
-        else:
-            # expect fp to be a seekable file(-like) object:
-            self._buffer = self._fp = fp
-        self._dataSize = 0
+        """
+        @param fp: a socket or file(-like) object to write the message to.
+                   If not given, finalize() returns the message as bytes.
+        """
+        self._fp = fp
+        self._commandType = commandType
+        self._chunks = []
+        # total number of bytes of the message, and how many of them have
+        # been passed on to fp already:
+        self._size = 0
+        self._flushedSize = 0
+        # size of the data part of the message, if known in advance:
+        self._messageSize = None
+        # data lengths of lists, which are needed for the headers of all
+        # enclosing lists again:
+        self._listLengths = {}
+        # attributes and data of data.frames and factors, prepared when
+        # their length is computed:
+        self._prepared = {}
         self._writeHeader(commandType)
 
-    def _getRetVal(self):
-        if self._fp is self._buffer:
-            # file(-like) object - data has been written, nothing to return
-            return None
-        elif not self._fp:
-            # data has only been written into buffer, so return its value:
-            return self._buffer.getvalue()
+    def _write(self, data):
+        self._chunks.append(data)
+        self._size += len(data)
+        if self._messageSize is not None and self._fp and \
+                self._size - self._flushedSize >= STREAM_BUFFER_SIZE:
+            self._flush()
+
+    def _flush(self):
+        """Pass all collected chunks on to the socket or file"""
+        if isinstance(self._fp, socket.socket):
+            _sendChunks(self._fp, self._chunks)
         else:
-            # i.e. socket: write result of _fp into socket-fp
-            self._fp.send(self._buffer.getvalue())
-            return None
+            # file(-like) object
+            for view in _coalesceChunks(self._chunks):
+                self._fp.write(view)
+        self._chunks = []
+        self._flushedSize = self._size
+
+    def _getRetVal(self):
+        if not self._fp:
+            # data has only been collected, so return its value:
+            if PY3:
+                return b''.join(self._chunks)
+            return b''.join(memoryview(chunk).tobytes()
+                            for chunk in self._chunks)
+        self._flush()
+        return None
+
+    def _packHeader(self, dataSize):
+        return struct.pack('<IIII', self._commandType,
+                           dataSize & 0xffffffff, 0, dataSize >> 32)
 
     def _writeHeader(self, commandType):
-        # Set length to zero initially, will be fixed in _finalizerHeader()
-        # when msg size is determined:
-        msg_length_lower = msg_length_higher = 0
-        data_offset = 0
-        header = struct.pack('<IIII', commandType, msg_length_lower,
-                             data_offset, msg_length_higher)
+        # Set length to zero initially. It is set by serializeAll() before
+        # any data is written, or fixed in finalize() otherwise:
+        header = self._packHeader(0)
         if DEBUG:
             print('Writing header: %d bytes: %s' % (len(header), repr(header)))
-        self._buffer.write(header)
+        self._write(header)
+
+    def serializeAll(self, params):
+        """
+        Serialize all parameters of the message and finalize it.
+        The size of the message is computed first, so that the message header
+        is complete before any data is serialized. Data is then passed on to
+        the socket or file in blocks while serializing, the memory needed is
+        bounded by STREAM_BUFFER_SIZE (plus copies of arrays which are not in
+        Fortran order).
+        @param params: list of (object, DT_* type code) tuples
+        """
+        # The lower 32 bits of the length go into bytes 4-7 of the header,
+        # the upper 32 bits into bytes 12-15:
+        self._messageSize = sum(self._paramSize(o, dtTypeCode)
+                                for o, dtTypeCode in params)
+        self._chunks[0] = self._packHeader(self._messageSize)
+        for o, dtTypeCode in params:
+            self.serialize(o, dtTypeCode)
+        return self.finalize()
 
     def finalize(self):
-        # and finally we correctly set the length of the entire data package
-        # (in bytes) minus header size:
-        # dataSize = self._fp.tell() - rtypes.RHEADER_SIZE
-        # TODO: Also handle data larger than 2**32
-        # (use upper part of message length!!)
-        assert self._dataSize < 2**32, \
-            'data larger than 2**32 not yet implemented'
-        self._buffer.seek(4)
-        if DEBUG:
-            print('writing size of header: %2d' % self._dataSize)
-        self._buffer.write(struct.pack('<I', self._dataSize))
+        dataSize = self._size - rtypes.RHEADER_SIZE
+        if self._messageSize is None:
+            # and finally we correctly set the length of the entire data
+            # package (in bytes) minus header size:
+            if DEBUG:
+                print('writing size of header: %2d' % dataSize)
+            self._chunks[0] = self._packHeader(dataSize)
+        else:
+            assert dataSize == self._messageSize, \
+                'Size of message has been computed incorrectly'
         return self._getRetVal()
 
-    def _writeDataHeader(self, rTypeCode, length):
+    @staticmethod
+    def _headerSize(length):
+        """Return size of the data header for a data block of 'length'"""
+        return 8 if length > rtypes.MAX_SMALL_LENGTH else 4
+
+    @staticmethod
+    def _packDataHeader(rTypeCode, length):
         """
         A data header consists of 4 bytes:
         [1]   rTypeCode
         [2-4] length of data block (3 bytes!!!)
+        If the length does not fit into 3 bytes, a large header of 8 bytes is
+        created instead:
+        [1]   rTypeCode | XT_LARGE  (same flag as DT_LARGE)
+        [2-8] length of data block (7 bytes)
         """
-        self._buffer.write(struct.pack('<Bi', rTypeCode, length)[:4])
+        if length > rtypes.MAX_SMALL_LENGTH:
+            return struct.pack('<BQ', rTypeCode | rtypes.XT_LARGE, length)[:8]
+        return struct.pack('<Bi', rTypeCode, length)[:4]
+
+    def _writeDataHeader(self, rTypeCode, length):
+        self._write(self._packDataHeader(rTypeCode, length))
+
+    def _paramSize(self, o, dtTypeCode):
+        """Return the number of bytes of a serialized message parameter"""
+        if dtTypeCode == rtypes.DT_STRING:
+            length = len(string2bytesPad4(o))
+        elif dtTypeCode == rtypes.DT_INT:
+            length = 4
+        elif dtTypeCode == rtypes.DT_BYTESTREAM:
+            length = len(o)
+        elif dtTypeCode == rtypes.DT_SEXP:
+            length = self._exprSize(o)
+        else:
+            raise NotImplementedError('no support for DT-type %x' % dtTypeCode)
+        return self._headerSize(length) + length
 
     def serialize(self, o, dtTypeCode=rtypes.DT_SEXP):
         # Here the data typecode (DT_* ) of the entire message is written,
@@ -109,38 +260,71 @@ class RSerializer(object):
             paddedString = string2bytesPad4(o)
             length = len(paddedString)
             self._writeDataHeader(dtTypeCode, length)
-            self._buffer.write(paddedString)
+            self._write(paddedString)
         elif dtTypeCode == rtypes.DT_INT:
             length = 4
             self._writeDataHeader(dtTypeCode, length)
-            self._buffer.write(struct.pack('<i', o))
+            self._write(struct.pack('<i', o))
+        elif dtTypeCode == rtypes.DT_BYTESTREAM:
+            self._writeDataHeader(dtTypeCode, len(o))
+            self._write(o)
         elif dtTypeCode == rtypes.DT_SEXP:
-            startPos = self._buffer.tell()
-            self._buffer.write(b'\0\0\0\0')
-            length = self.serializeExpr(o)
-            self._buffer.seek(startPos)
-            self._writeDataHeader(dtTypeCode, length)
+            self._writeDataHeader(dtTypeCode, self._exprSize(o))
+            self.serializeExpr(o)
         else:
             raise NotImplementedError('no support for DT-type %x' % dtTypeCode)
-        self._dataSize += length + 4
 
-    def serializeExpr(self, o):
+    @staticmethod
+    def _exprTypeCode(o):
+        """Return the key of the serialization functions for o"""
         if isinstance(o, numpy.ndarray):
-            rTypeCode = rtypes.numpyMap[o.dtype.type]
-        else:
-            rTypeCode = type(o)
+            if o.dtype.names is not None:
+                # structured (record) arrays are sent as data.frames
+                return DATA_FRAME
+            elif isinstance(o, Factor):
+                return FACTOR
+            return rtypes.numpyMap[o.dtype.type]
+        if pandas is not None:
+            if isinstance(o, pandas.DataFrame):
+                return DATA_FRAME
+            elif isinstance(o, pandas.Categorical):
+                return FACTOR
+        return type(o)
+
+    def _exprSize(self, o):
+        """
+        Return the number of bytes of the serialized expression o, including
+        its header
+        """
+        if o is None:
+            # NULL consists of a header only
+            return 4
+        length = self._dataLength(o)
+        return self._headerSize(length) + length
+
+    def _dataLength(self, o):
+        """Return the length of the data block of the serialized object o"""
+        try:
+            l_func = self.lengthMap[self._exprTypeCode(o)]
+        except KeyError:
+            raise NotImplementedError('Serialization of "%s" not implemented' %
+                                      self._exprTypeCode(o))
+        return l_func(self, o)
+
+    def serializeExpr(self, o):
+        rTypeCode = self._exprTypeCode(o)
         try:
             s_func = self.serializeMap[rTypeCode]
         except KeyError:
             raise NotImplementedError('Serialization of "%s" not implemented' %
                                       rTypeCode)
-        startPos = self._buffer.tell()
+        startPos = self._size
         if DEBUG:
             print('Serializing expr %r with rTypeCode=%s using function %s' %
                   (o, rTypeCode, s_func))
         s_func(self, o)
         # determine and return the length of actual R expression data:
-        return self._buffer.tell() - startPos
+        return self._size - startPos
 
     @fmap(NoneType, rtypes.XT_NULL)
     def s_null(self, o):
@@ -163,45 +347,99 @@ class RSerializer(object):
         if DEBUG:
             print('Writing string: %2d bytes: %s' %
                   (length, repr(paddedString)))
-        self._buffer.write(paddedString)
+        self._write(paddedString)
 
     ################ Arrays #########################################
 
-    def __s_write_xt_array_tag_data(self, o):
+    @staticmethod
+    def _arrayData(o):
+        """
+        Return the data of array o as a flat array of bytes, in Fortran order
+        as expected by R. No data is copied if o is Fortran-contiguous (which
+        includes all contiguous one-dimensional arrays).
+        """
+        # TODO: make this also work on big endian machines (data must be
+        #       written in little-endian!!)
+        return numpy.asfortranarray(o).ravel(order='F').view(numpy.uint8)
+
+    @staticmethod
+    def _arrayTags(o):
         """
-        Write tag data of an array, like dimension for a multi-dim array,
-        or other information found. Return appropriate rTypeCode.
+        Return tag data of an array, like dimension for a multi-dim array,
+        or other information found.
         """
         xt_tag_list = []
         if o.ndim > 1:
             xt_tag_list.append((b'dim', numpy.array(o.shape, numpy.int32)))
         if isinstance(o, TaggedArray):
             xt_tag_list.append((b'names', numpy.array(o.attr)))
+        return xt_tag_list
 
+    def _arrayTagsSize(self, o):
+        xt_tag_list = self._arrayTags(o)
+        return self._tagListSize(xt_tag_list) if xt_tag_list else 0
+
+    def __s_write_xt_array_header(self, o, length):
+        """
+        Write header and tag data of an array. Return appropriate rTypeCode.
+        @arg length: length of the array data, without tag data
+        """
+        xt_tag_list = self._arrayTags(o)
         attrFlag = rtypes.XT_HAS_ATTR if xt_tag_list else 0
         rTypeCode = rtypes.numpyMap[o.dtype.type] | attrFlag
-        # write length of zero for now, will be corrected later:
-        self._writeDataHeader(rTypeCode, 0)
+        if attrFlag:
+            length += self._tagListSize(xt_tag_list)
+        self._writeDataHeader(rTypeCode, length)
         if attrFlag:
             self.s_xt_tag_list(xt_tag_list)
         return rTypeCode
 
-    def __s_update_xt_array_header(self, headerPos, rTypeCode):
+    @staticmethod
+    def _stringArrayData(o):
         """
-        Update length information of xt array header which has been
-        previously temporarily set to 0 in __s_write_xt_array_tag_data()
-        @arg headerPos: file position where header information should be
-                        written.
-        @arg rTypeCode
+        Return the strings of an array as null-terminated strings, and the
+        padding needed
         """
-        # subtract length of header (4 bytes), does not count to payload!
-        length = self._buffer.tell() - headerPos - 4
-        self._buffer.seek(headerPos)
-        self._writeDataHeader(rTypeCode, length)
-        self._buffer.seek(0, os.SEEK_END)
+        bo = RSerializer._stringArrayItems(o)
+        # add empty string to that the following join with \0 adds an
+        # additional zero at the end of the last string!
+        bo.append(b'')
+        # Concatenate them as null-terminated strings:
+        nullTerminatedStrings = b'\0'.join(bo)
+        padding = b'\1\1\1\1'[:padLen4(nullTerminatedStrings)]
+        return nullTerminatedStrings, padding
+
+    @staticmethod
+    def _stringArrayItems(o):
+        """
+        Return the byte-encoded strings of an array, masked items of a masked
+        array become NA
+        """
+        # reshape into 1d array:
+        o1d = o.reshape(o.size, order='F')
+        if isinstance(o, numpy.ma.MaskedArray):
+            mask = numpy.ma.getmaskarray(o1d)
+            return [rtypes.STR_NA if masked else byteEncode(d)
+                    for d, masked in zip(o1d.data, mask)]
+        return [byteEncode(d) for d in o1d]
+
+    @lmap(*rtypes.STRING_TYPES)
+    def l_atom_to_xt_array_str(self, o):
+        # a single null-terminated string, padded to a multiple of 4. Like
+        # numpy.array([o]) in s_atom_to_xt_array_str() trailing nulls are
+        # dropped:
+        length = len(byteEncode(o).rstrip(b'\0')) + 1
+        return length + -length % 4
+
+    @lmap(rtypes.XT_ARRAY_STR)
+    def l_xt_array_str(self, o):
+        # This is just the length of the strings, so avoid concatenating them:
+        length = sum(len(d) + 1 for d in self._stringArrayItems(o))
+        # strings are padded to a multiple of 4 in length:
+        return self._arrayTagsSize(o) + length + -length % 4
 
     @fmap(*rtypes.STRING_TYPES)
-    def s_xt_array_str(self, o):
+    def s_atom_to_xt_array_str(self, o):
         """Serialize single string object"""
         arr = numpy.array([o])
         self.s_xt_array_str(arr)
@@ -209,25 +447,20 @@ class RSerializer(object):
     @fmap(rtypes.XT_ARRAY_STR)
     def s_xt_array_str(self, o):
         """Serialize array of strings"""
-        startPos = self._buffer.tell()
-        rTypeCode = self.__s_write_xt_array_tag_data(o)
-
-        # reshape into 1d array:
-        o1d = o.reshape(o.size, order='F')
-        # Byte-encode them:
-        bo = [byteEncode(d) for d in o1d]
-        # add empty string to that the following join with \0 adds an
-        # additional zero at the end of the last string!
-        bo.append(b'')
-        # Concatenate them as null-terminated strings:
-        nullTerminatedStrings = b'\0'.join(bo)
+        nullTerminatedStrings, padding = self._stringArrayData(o)
+        self.__s_write_xt_array_header(
+            o, len(nullTerminatedStrings) + len(padding))
+        self._write(nullTerminatedStrings)
+        self._write(padding)
 
-        padLength = padLen4(nullTerminatedStrings)
-        self._buffer.write(nullTerminatedStrings)
-        self._buffer.write(b'\1\1\1\1'[:padLength])
+    @lmap(bool, numpy.bool_)
+    def l_atom_to_xt_array_boolean(self, o):
+        return 8
 
-        # Update the array header:
-        self.__s_update_xt_array_header(startPos, rTypeCode)
+    @lmap(rtypes.XT_ARRAY_BOOL)
+    def l_xt_array_boolean(self, o):
+        # values are padded to a multiple of 4 in length:
+        return self._arrayTagsSize(o) + 4 + o.size + -o.size % 4
 
     @fmap(bool, numpy.bool_)
     def s_atom_to_xt_array_boolean(self, o):
@@ -247,29 +480,25 @@ class RSerializer(object):
         Note: If o is multi-dimensional a tagged array is created. Also if o
               is of type TaggedArray.
         """
-        startPos = self._buffer.tell()
-        rTypeCode = self.__s_write_xt_array_tag_data(o)
-
+        # Note that R expects binary array data in Fortran order, so prepare
+        # this accordingly:
+        data = self._arrayData(self._fillNA(o))
+        padding = padLen4(data) * b'\xff'
+        self.__s_write_xt_array_header(o, 4 + len(data) + len(padding))
         # A boolean vector starts with its number of boolean values in the
         # vector (as int32):
         structCode = '<'+rtypes.structMap[int]
-        self._buffer.write(struct.pack(structCode, o.size))
-        # Then write the boolean values themselves. Note that R expects binary
-        # array data in Fortran order, so prepare this accordingly:
-        data = o.tostring(order='F')
-        self._buffer.write(data)
+        self._write(struct.pack(structCode, o.size))
+        # Then write the boolean values themselves:
+        self._write(data)
         # Finally pad the binary data to be of a multiple of four in length:
-        self._buffer.write(padLen4(data) * b'\xff')
-
-        # Update the array header:
-        self.__s_update_xt_array_header(startPos, rTypeCode)
+        self._write(padding)
 
-    @fmap(int, numpy.int32, long, numpy.int64, numpy.long, float, complex,
-          numpy.float64, numpy.complex, numpy.complex64, numpy.complex128)
-    def s_atom_to_xt_array_numeric(self, o):
+    @staticmethod
+    def _packAtom(o):
         """
-        Render single numeric items into their corresponding array counterpart
-        in R
+        Return the rTypeCode of the R array a single numeric item is
+        rendered into, and its binary data
         """
         if isinstance(o, (int, long, numpy.int64, numpy.long)):
             if rtypes.MIN_INT32 <= o <= rtypes.MAX_INT32:
@@ -282,14 +511,48 @@ class RSerializer(object):
 
         rTypeCode = rtypes.atom2ArrMap[type(o)]
         structCode = '<'+rtypes.structMap[type(o)]
-        length = struct.calcsize(structCode)
         if type(o) is complex:
-            self._writeDataHeader(rTypeCode, length*2)
-            self._buffer.write(struct.pack(structCode, o.real))
-            self._buffer.write(struct.pack(structCode, o.imag))
+            data = struct.pack(structCode, o.real) + \
+                struct.pack(structCode, o.imag)
         else:
-            self._writeDataHeader(rTypeCode, length)
-            self._buffer.write(struct.pack(structCode, o))
+            data = struct.pack(structCode, o)
+        return rTypeCode, data
+
+    @lmap(int, numpy.int32, long, numpy.int64, numpy.long, float, complex,
+          numpy.float64, numpy.complex, numpy.complex64, numpy.complex128)
+    def l_atom_to_xt_array_numeric(self, o):
+        if isinstance(o, complex):
+            return 16
+        elif isinstance(o, float):
+            return 8
+        elif not rtypes.MIN_INT32 <= o <= rtypes.MAX_INT32:
+            raise ValueError('Cannot serialize long integers larger than '
+                             'MAX_INT32 (**31-1)')
+        return 4
+
+    @fmap(int, numpy.int32, long, numpy.int64, numpy.long, float, complex,
+          numpy.float64, numpy.complex, numpy.complex64, numpy.complex128)
+    def s_atom_to_xt_array_numeric(self, o):
+        """
+        Render single numeric items into their corresponding array counterpart
+        in R
+        """
+        rTypeCode, data = self._packAtom(o)
+        self._writeDataHeader(rTypeCode, len(data))
+        self._write(data)
+
+    @lmap(rtypes.XT_ARRAY_CPLX, rtypes.XT_ARRAY_DOUBLE, rtypes.XT_ARRAY_INT)
+    def l_xt_array_numeric(self, o):
+        itemSize = o.dtype.itemsize
+        if o.dtype in (numpy.int64, numpy.long):
+            # long integer arrays are sent as int32 arrays. Check their range
+            # already here, before any data of the message has been sent:
+            if o.size and not (rtypes.MIN_INT32 <= o.min() and
+                               o.max() <= rtypes.MAX_INT32):
+                raise ValueError('Cannot serialize long integer arrays with '
+                                 'values outside MAX_INT32 (2**31-1) range')
+            itemSize = 4
+        return self._arrayTagsSize(o) + o.size * itemSize
 
     @fmap(rtypes.XT_ARRAY_CPLX, rtypes.XT_ARRAY_DOUBLE, rtypes.XT_ARRAY_INT)
     def s_xt_array_numeric(self, o):
@@ -299,60 +562,231 @@ class RSerializer(object):
                is of type TaggedArray.
         """
         if o.dtype in (numpy.int64, numpy.long):
-            if rtypes.MIN_INT32 <= o.min() and o.max() <= rtypes.MAX_INT32:
-                # even though this type of array is 'long' its values still
-                # fit into a normal int32 array. Good!
-                o = o.astype(numpy.int32)
-            else:
-                raise ValueError('Cannot serialize long integer arrays with '
-                                 'values outside MAX_INT32 (2**31-1) range')
-
-        startPos = self._buffer.tell()
-        rTypeCode = self.__s_write_xt_array_tag_data(o)
-
-        # TODO: make this also work on big endian machines (data must be
-        #       written in little-endian!!)
+            # even though this type of array is 'long' its values fit into a
+            # normal int32 array (checked in l_xt_array_numeric()). Good!
+            o = o.astype(numpy.int32)
 
-        # Note: R expects binary array data in Fortran order, so prepare this
-        # accordingly:
-        self._buffer.write(o.tostring(order='F'))
+        data = self._arrayData(self._fillNA(o))
+        self.__s_write_xt_array_header(o, len(data))
+        self._write(data)
 
-        # Update the array header:
-        self.__s_update_xt_array_header(startPos, rTypeCode)
+    @staticmethod
+    def _fillNA(o):
+        """
+        Return the data of a masked array, with R's NA values at all masked
+        positions. Other arrays are returned unchanged.
+        """
+        if not isinstance(o, numpy.ma.MaskedArray):
+            return o
+        if o.dtype.kind == 'b':
+            # R's logical NA is sent as byte 2:
+            return numpy.where(numpy.ma.getmaskarray(o),
+                               numpy.uint8(rtypes.BOOL_NA),
+                               o.data.view(numpy.uint8))
+        elif o.dtype.kind == 'c':
+            return o.filled(complex(rtypes.REAL_NA, rtypes.REAL_NA))
+        elif o.dtype.kind == 'f':
+            return o.filled(rtypes.REAL_NA)
+        return o.filled(rtypes.INT_NA)
 
     ############### Vectors and Tag lists #####################################
 
+    @staticmethod
+    def _vectorNames(o):
+        """Return the names attribute of a TaggedList as tag list"""
+        # items without a key get an empty name in R:
+        names = ['' if key is None else key for key in o.keys]
+        return [(b'names', numpy.array(names))]
+
+    @lmap(list, TaggedList)
+    def l_xt_vector(self, o):
+        # Computing the length of a list requires to visit all its items, so
+        # remember it for the headers of lists containing this one. The list
+        # is part of the object tree to be serialized, so its id is unique
+        # as long as the serializer is in use.
+        try:
+            return self._listLengths[id(o)]
+        except KeyError:
+            pass
+        length = sum(self._exprSize(v) for v in o)
+        if o.__class__ == TaggedList:
+            length += self._tagListSize(self._vectorNames(o))
+        self._listLengths[id(o)] = length
+        return length
+
     @fmap(list, TaggedList)
     def s_xt_vector(self, o):
         """Render all objects of given python list into generic r vector"""
-        startPos = self._buffer.tell()
-        # remember start position for calculating length in bytes of entire
-        # list content
         attrFlag = rtypes.XT_HAS_ATTR if o.__class__ == TaggedList else 0
-        self._writeDataHeader(rtypes.XT_VECTOR | attrFlag, 0)
+        self._writeDataHeader(rtypes.XT_VECTOR | attrFlag, self._dataLength(o))
         if attrFlag:
-            self.s_xt_tag_list([(b'names', numpy.array(o.keys))])
+            self.s_xt_tag_list(self._vectorNames(o))
         for v in o:
             self.serializeExpr(v)
-        length = self._buffer.tell() - startPos
-        self._buffer.seek(startPos)
-        # now write header again with correct length information
-        # subtract 4 (omit list header!)
-        self._writeDataHeader(rtypes.XT_VECTOR | attrFlag, length - 4)
-        self._buffer.seek(0, os.SEEK_END)
+
+    def _tagListLength(self, o):
+        """Return the length of the data block of a tag list"""
+        length = 0
+        for tag, data in o:
+            tagLength = len(string2bytesPad4(tag))
+            length += self._exprSize(data) + \
+                self._headerSize(tagLength) + tagLength
+        return length
+
+    def _tagListSize(self, o):
+        """Return the size of a serialized tag list, including its header"""
+        length = self._tagListLength(o)
+        return self._headerSize(length) + length
 
     def s_xt_tag_list(self, o):
-        startPos = self._buffer.tell()
-        self._writeDataHeader(rtypes.XT_LIST_TAG, 0)
+        self._writeDataHeader(rtypes.XT_LIST_TAG, self._tagListLength(o))
         for tag, data in o:
             self.serializeExpr(data)
             self.s_string_or_symbol(tag, rTypeCode=rtypes.XT_SYMNAME)
-        length = self._buffer.tell() - startPos
-        self._buffer.seek(startPos)
-        # now write header again with correct length information
-        # subtract 4 (omit list header!)
-        self._writeDataHeader(rtypes.XT_LIST_TAG, length - 4)
-        self._buffer.seek(0, os.SEEK_END)
+
+    ############### Data frames and factors ###################################
+
+    def _prepare(self, o, prepareFunc):
+        """
+        Return the attributes (as tag list) and data of a data.frame or
+        factor. They are needed for computing its length as well as for
+        serializing it, so they are only created once.
+        """
+        try:
+            return self._prepared[id(o)]
+        except KeyError:
+            prepared = self._prepared[id(o)] = prepareFunc(o)
+            return prepared
+
+    @staticmethod
+    def _frameColumn(name, column):
+        """
+        Return the data of a DataFrame column to be sent to R. Numeric
+        columns are sent as they are (if their type is supported by R),
+        missing values of other columns are masked and hence become NA.
+        """
+        values = column.values
+        if isinstance(values, pandas.Categorical):
+            return values
+        if isinstance(values, numpy.ndarray) and values.dtype != object:
+            kind = values.dtype.kind
+            if kind == 'f':
+                return values.astype(numpy.float64, copy=False)
+            elif kind == 'c':
+                return values.astype(numpy.complex128, copy=False)
+            elif kind in 'iu':
+                if values.dtype not in (numpy.int32, numpy.int64):
+                    # range of e.g. uint64 columns is checked when
+                    # serializing them as int32:
+                    values = values.astype(numpy.int64)
+                return values
+            elif kind == 'b':
+                return values
+        else:
+            # object columns and pandas' nullable types (e.g. Int64, string)
+            inferred = pandas.api.types.infer_dtype(column, skipna=True)
+            dtype, fill = {'string': (str, ''),
+                           'empty': (str, ''),
+                           'boolean': (bool, False),
+                           'integer': (numpy.int64, 0),
+                           'floating': (numpy.float64, 0.0),
+                           'mixed-integer-float': (numpy.float64, 0.0),
+                           }.get(inferred, (None, None))
+            if dtype is not None:
+                mask = column.isna().values
+                values = column.to_numpy(dtype=dtype, na_value=fill)
+                if mask.any():
+                    values = numpy.ma.MaskedArray(values, mask=mask)
+                return values
+        raise NotImplementedError('Serialization of data.frame column "%s" '
+                                  'of type %s not implemented' %
+                                  (name, column.dtype))
+
+    @classmethod
+    def _prepareDataFrame(cls, o):
+        """
+        Return the attributes and columns of a DataFrame or structured array
+        """
+        if isinstance(o, numpy.ndarray):
+            if o.ndim != 1:
+                raise ValueError('Only one-dimensional structured arrays can '
+                                 'be serialized')
+            names = list(o.dtype.names)
+            columns = [o[name] for name in names]
+            rowNames = None
+        else:
+            names = [str(name) for name in o.columns]
+            columns = [cls._frameColumn(name, o.iloc[:, idx])
+                       for idx, name in enumerate(names)]
+            index = o.index
+            if (isinstance(index, pandas.RangeIndex) and index.start == 0 and
+                    index.step == 1) or not index.is_unique:
+                rowNames = None
+            else:
+                rowNames = numpy.array([str(name) for name in index])
+        if rowNames is None:
+            # R's compact form of the row names 1..n:
+            rowNames = numpy.array([rtypes.INT_NA, -len(o)], numpy.int32)
+        attr = [(b'names', numpy.array(names, dtype=str)),
+                (b'row.names', rowNames),
+                (b'class', numpy.array(['data.frame']))]
+        return attr, columns
+
+    @lmap(DATA_FRAME)
+    def l_data_frame(self, o):
+        attr, columns = self._prepare(o, self._prepareDataFrame)
+        return self._tagListSize(attr) + \
+            sum(self._exprSize(column) for column in columns)
+
+    @fmap(DATA_FRAME)
+    def s_data_frame(self, o):
+        """
+        Render a pandas DataFrame or a structured numpy array into an R
+        data.frame, i.e. a vector of its columns with names, row.names and
+        class attributes
+        """
+        attr, columns = self._prepare(o, self._prepareDataFrame)
+        self._writeDataHeader(rtypes.XT_VECTOR | rtypes.XT_HAS_ATTR,
+                              self._dataLength(o))
+        self.s_xt_tag_list(attr)
+        for column in columns:
+            self.serializeExpr(column)
+
+    @staticmethod
+    def _prepareFactor(o):
+        """
+        Return the attributes and integer codes of a Factor or a pandas
+        Categorical
+        """
+        if isinstance(o, Factor):
+            # the codes are sent as they are
+            codes, levels = o.codes, o.levels
+        else:
+            # R's codes start at 1, missing values (code -1) become NA:
+            codes = numpy.where(o.codes < 0, rtypes.INT_NA,
+                                o.codes.astype(numpy.int32) + 1)
+            levels = numpy.array([str(level) for level in o.categories],
+                                 dtype=str)
+        classes = ['ordered', 'factor'] if o.ordered else ['factor']
+        attr = [(b'levels', levels), (b'class', numpy.array(classes))]
+        return attr, codes.astype(numpy.int32, copy=False)
+
+    @lmap(FACTOR)
+    def l_factor(self, o):
+        attr, codes = self._prepare(o, self._prepareFactor)
+        return self._tagListSize(attr) + codes.size * 4
+
+    @fmap(FACTOR)
+    def s_factor(self, o):
+        """
+        Render a Factor or a pandas Categorical into an R factor, i.e. an
+        integer vector of codes with levels and class attributes
+        """
+        attr, codes = self._prepare(o, self._prepareFactor)
+        self._writeDataHeader(rtypes.XT_ARRAY_INT | rtypes.XT_HAS_ATTR,
+                              self._dataLength(o))
+        self.s_xt_tag_list(attr)
+        self._write(self._arrayData(codes))
 
     ############################################################
     #### class methods for calling specific Rserv functions ####
@@ -364,9 +798,7 @@ class RSerializer(object):
         Rserve
         """
         cmd = rtypes.CMD_voidEval if void else rtypes.CMD_eval
-        s = cls(cmd, fp=fp)
-        s.serialize(aString, dtTypeCode=rtypes.DT_STRING)
-        return s.finalize()
+        return cls(cmd, fp=fp).serializeAll([(aString, rtypes.DT_STRING)])
 
     @classmethod
     def rAssign(cls, varname, o, fp=None):
@@ -374,22 +806,83 @@ class RSerializer(object):
         Create binary code for assigning an expression to a variable remotely
         in Rserve
         """
-        s = cls(rtypes.CMD_setSEXP, fp=fp)
-        s.serialize(varname, dtTypeCode=rtypes.DT_STRING)
-        s.serialize(o, dtTypeCode=rtypes.DT_SEXP)
-        return s.finalize()
+        return cls(rtypes.CMD_setSEXP, fp=fp).serializeAll([
+            (varname, rtypes.DT_STRING),
+            (o, rtypes.DT_SEXP)])
+
+    @classmethod
+    def rDetachSession(cls, fp=None):
+        """Create binary code for detaching the current session in Rserve"""
+        return cls(rtypes.CMD_detachSession, fp=fp).serializeAll([])
+
+    @classmethod
+    def rDetachedVoidEval(cls, aString, fp=None):
+        """
+        Create binary code for detaching the current session in Rserve and
+        evaluating a string expression afterwards
+        """
+        return cls(rtypes.CMD_detachedVoidEval, fp=fp).serializeAll([
+            (aString, rtypes.DT_STRING)])
+
+    @classmethod
+    def rOpenFile(cls, filename, fp=None):
+        """Create binary code for opening a file on the Rserve host"""
+        return cls(rtypes.CMD_openFile, fp=fp).serializeAll([
+            (filename, rtypes.DT_STRING)])
+
+    @classmethod
+    def rCreateFile(cls, filename, fp=None):
+        """
+        Create binary code for creating (or truncating) a file on the Rserve
+        host and opening it for writing
+        """
+        return cls(rtypes.CMD_createFile, fp=fp).serializeAll([
+            (filename, rtypes.DT_STRING)])
+
+    @classmethod
+    def rCloseFile(cls, fp=None):
+        """Create binary code for closing the currently open file"""
+        return cls(rtypes.CMD_closeFile, fp=fp).serializeAll([])
+
+    @classmethod
+    def rReadFile(cls, size, fp=None):
+        """
+        Create binary code for reading up to 'size' bytes from the currently
+        open file
+        """
+        return cls(rtypes.CMD_readFile, fp=fp).serializeAll([
+            (size, rtypes.DT_INT)])
+
+    @classmethod
+    def rWriteFile(cls, data, fp=None):
+        """
+        Create binary code for writing a block of bytes to the currently
+        open file
+        """
+        return cls(rtypes.CMD_writeFile, fp=fp).serializeAll([
+            (data, rtypes.DT_BYTESTREAM)])
+
+    @classmethod
+    def rRemoveFile(cls, filename, fp=None):
+        """Create binary code for removing a file on the Rserve host"""
+        return cls(rtypes.CMD_removeFile, fp=fp).serializeAll([
+            (filename, rtypes.DT_STRING)])
+
+    @classmethod
+    def rSetBufferSize(cls, size, fp=None):
+        """Create binary code for setting the send buffer size of Rserve"""
+        return cls(rtypes.CMD_setBufferSize, fp=fp).serializeAll([
+            (size, rtypes.DT_INT)])
 
     @classmethod
     def rShutdown(cls, fp=None):
-        s = cls(rtypes.CMD_shutdown, fp=fp)
-        return s.finalize()
+        return cls(rtypes.CMD_shutdown, fp=fp).serializeAll([])
 
     @classmethod
     def rSerializeResponse(cls, Rexp, fp=None):
         # mainly used for unittesting
-        s = cls(rtypes.RESP_OK, fp=fp)
-        s.serialize(Rexp, dtTypeCode=rtypes.DT_SEXP)
-        return s.finalize()
+        return cls(rtypes.RESP_OK, fp=fp).serializeAll([
+            (Rexp, rtypes.DT_SEXP)])
 
 
 # Some shortcuts:
@@ -397,3 +890,12 @@ rEval = RSerializer.rEval
 rAssign = RSerializer.rAssign
 rSerializeResponse = RSerializer.rSerializeResponse
 rShutdown = RSerializer.rShutdown
+rDetachSession = RSerializer.rDetachSession
+rDetachedVoidEval = RSerializer.rDetachedVoidEval
+rOpenFile = RSerializer.rOpenFile
+rCreateFile = RSerializer.rCreateFile
+rCloseFile = RSerializer.rCloseFile
+rReadFile = RSerializer.rReadFile
+rWriteFile = RSerializer.rWriteFile
+rRemoveFile = RSerializer.rRemoveFile
+rSetBufferSize = RSerializer.rSetBufferSize
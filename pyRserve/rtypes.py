@@ -12,6 +12,8 @@ MIN_INT32 = -MAX_INT32
 # Rserve constants and mappings ###############################################
 
 RHEADER_SIZE = 16             # Rserve header size
+MAX_SMALL_LENGTH = 0xfffff0   # max. length of data for a 4 bytes data header,
+                              #   beyond that a large (8 bytes) header is used
 
 
 CMD_RESP = 0x10000            # all responses have this flag set
@@ -255,6 +257,15 @@ BOOL_TRUE   = 1
 BOOL_FALSE  = 0
 BOOL_NA     = 2
 
+# R represents a missing integer (NA_integer_) by the smallest 32bit integer:
+INT_NA      = -2**31
+# A missing double (NA_real_) is a NaN whose lower 32 bits are 1954:
+REAL_NA_LOW_WORD = 1954
+REAL_NA     = numpy.array([0x7FF00000000007A2], numpy.uint64).view(
+    numpy.float64)[0]
+# A missing string (NA_character_) is sent as a single byte 0xff:
+STR_NA      = b'\xff'
+
 VALID_R_TYPES = [
     DT_SEXP, XT_BOOL, XT_INT, XT_DOUBLE, XT_STR, XT_SYMNAME, XT_VECTOR,
     XT_LIST_TAG, XT_LANG_TAG, XT_LIST_NOTAG, XT_LANG_NOTAG, XT_CLOS,
@@ -262,6 +273,8 @@ VALID_R_TYPES = [
     XT_VECTOR_EXP, XT_NULL, XT_UNKNOWN, XT_RAW, XT_S4
 ]
 
+VALID_DT_TYPES = [DT_INT, DT_STRING, DT_BYTESTREAM, DT_SEXP]
+
 STRING_TYPES = [str, numpy.string_, numpy.str_]
 if not PY3:
     STRING_TYPES.append(unicode)
@@ -6,9 +6,13 @@ None. In those cases only the first item with that key is found.
 
 Available classes:
 - TaggedList
+- LazyTaggedList
 - TaggedArray
+- Factor
 """
 import numpy
+###
+from .rtypes import INT_NA
 
 
 class TaggedList(object):
@@ -82,9 +86,9 @@ class TaggedList(object):
     __hash__ = None  # Mutable sequence, so not hashable
 
     def __eq__(self, other):
-        if not isinstance(other, self.__class__):
+        if not isinstance(other, TaggedList):
             return False
-        return self.__dict__ == other.__dict__
+        return self.keys == other.keys and self.values == other.values
 
     def __ne__(self, other):
         return not self.__eq__(other)
@@ -242,6 +246,70 @@ class TaggedList(object):
         #      self.values.extend(other)
 
 
+class _LazyValue(object):
+    """Placeholder for a value of a LazyTaggedList not created yet"""
+    __slots__ = ('create',)
+
+    def __init__(self, create):
+        self.create = create
+
+
+class LazyTaggedList(TaggedList):
+    """
+    A TaggedList whose values are only created when they are accessed for the
+    first time, e.g. for decoding the items of large nested results from R
+    on demand.
+
+    Values are given as functions (without arguments) which create them.
+    Operations which need all values (like comparing or printing the list,
+    or accessing its attribute 'values') create all of them.
+
+    Example:
+    l = LazyTaggedList(['a', 'b'], [lambda: 1, lambda: expensive()])
+    l['a']   # returns 1, expensive() has not been called
+    """
+    def __init__(self, keys, valueFactories):
+        TaggedList.__init__(self)
+        self.keys = [None if key == '' else key for key in keys]
+        self._values = [_LazyValue(factory) for factory in valueFactories]
+
+    @property
+    def values(self):
+        self._createAll()
+        return self._values
+
+    @values.setter
+    def values(self, values):
+        self._values = values
+
+    def _value(self, i):
+        value = self._values[i]
+        if isinstance(value, _LazyValue):
+            value = self._values[i] = value.create()
+        return value
+
+    def _createAll(self):
+        for i in range(len(self._values)):
+            self._value(i)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __getitem__(self, i):
+        if type(i) == str:
+            i = self.keys.index(i)
+        if isinstance(i, slice):
+            return [self._value(j) for j in range(*i.indices(len(self)))]
+        return self._value(i)
+
+    def __getslice__(self, i, j):
+        return TaggedList(self.astuples()[max(i, 0):max(j, 0)])
+
+    def pop(self, i=-1):
+        self._value(i)
+        return self._values.pop(i)
+
+
 class AttrArray(numpy.ndarray):
     """
     numpy.ndarray with additional "attr"-container.
@@ -279,6 +347,69 @@ def asAttrArray(data, attr):
     return AttrArray.new(data, attr)
 
 
+class Factor(AttrArray):
+    """
+    An R factor, i.e. an array of integer codes referring to its levels. As
+    in R the codes start at 1, missing values (NA) have the code INT_NA.
+    The levels and the class of the factor are kept in 'attr' as for any
+    AttrArray.
+
+    Only the codes are stored per item, the level strings are only created
+    when converting the factor via astype(str) or astype(object). In the
+    result missing values become '' or None respectively.
+
+    Example:
+    f = Factor.new(numpy.array([1, 2, 1], numpy.int32),
+                   {'levels': numpy.array(['a', 'b'])})
+    f.levels          # returns array(['a', 'b'])
+    f.astype(str)     # returns array(['a', 'b', 'a'])
+    """
+    def __array_finalize__(self, obj):
+        # keep levels and class for slices of a factor
+        self.attr = getattr(obj, 'attr', None)
+
+    def __array_wrap__(self, obj, context=None, returnScalar=False):
+        # results of ufuncs (e.g. f * 2 or f == 1) don't refer to the levels
+        # anymore, so they become plain arrays (or scalars):
+        if obj.ndim == 0:
+            return obj[()]
+        return obj.view(numpy.ndarray)
+
+    @property
+    def codes(self):
+        """The integer codes as plain numpy array (without copying them)"""
+        return self.view(numpy.ndarray)
+
+    @property
+    def levels(self):
+        return numpy.atleast_1d(self.attr['levels'])
+
+    @property
+    def ordered(self):
+        return 'ordered' in list(numpy.atleast_1d(self.attr.get('class', [])))
+
+    def astype(self, dtype, *args, **kw):
+        """
+        Convert into an array of the levels of all items for string or object
+        dtypes, otherwise just convert the codes
+        """
+        dtype = numpy.dtype(dtype)
+        if dtype.kind not in 'USO':
+            return self.codes.astype(dtype, *args, **kw)
+        codes = self.codes
+        # look up all items at once, missing values refer to an additional
+        # item appended to the levels:
+        levels = self.levels.astype(dtype)
+        naValue = None if dtype.kind == 'O' else ''
+        labels = numpy.append(levels, numpy.array([naValue], dtype=dtype))
+        return labels.take(numpy.where(codes == INT_NA, len(levels),
+                                       codes - 1))
+
+
+def asFactor(codes, attr):
+    return Factor.new(codes, attr)
+
+
 class TaggedArray(AttrArray):
     """
     A tagged array is useful for additionally addressing individual items by
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark comparing the number of recv() system calls and the time needed
+for parsing responses directly from a socket and through a SocketReader.
+No Rserve is needed, responses are sent through a local socket pair.
+
+By default the parser receives the data part of every message at once after
+its header, so only the headers of pipelined small responses cost a recv()
+call each. Items are read one after another (header, then data) only if
+large arrays are spilled to disk, which the second scenario measures by
+passing a spill directory.
+
+Usage: python -m testing.bench_reader
+"""
+import shutil
+import socket
+import tempfile
+import threading
+import time
+###
+import numpy
+###
+from pyRserve import rserializer, rparser
+
+
+class CountingSocket(socket.socket):
+    """Socket counting the recv() system calls made by the parser"""
+    recvCalls = 0
+
+    def recv_into(self, *args):
+        self.recvCalls += 1
+        return socket.socket.recv_into(self, *args)
+
+
+def run(messages, useReader, spillDir=None):
+    sender, receiver = socket.socketpair()
+    receiver = CountingSocket(receiver.family, receiver.type,
+                              fileno=receiver.detach())
+    src = rparser.SocketReader(receiver) if useReader else receiver
+    data = b''.join(messages)
+    thread = threading.Thread(target=sender.sendall, args=(data,))
+    thread.start()
+    start = time.time()
+    for _ in messages:
+        rparser.rparse(src, spillDir=spillDir)
+    duration = time.time() - start
+    thread.join()
+    sender.close()
+    receiver.close()
+    return receiver.recvCalls, duration
+
+
+def main():
+    spillDir = tempfile.mkdtemp()
+    scenarios = [
+        ('20000 small responses (e.g. evalMany())',
+         [rserializer.rSerializeResponse(idx) for idx in range(20000)],
+         None),
+        ('one list of 50000 short vectors, read item by item',
+         [rserializer.rSerializeResponse(
+             [numpy.array([idx, idx + 1]) for idx in range(50000)])],
+         spillDir),
+    ]
+    try:
+        for title, messages, scenarioSpillDir in scenarios:
+            print(title)
+            for useReader in (False, True):
+                recvCalls, duration = run(messages, useReader,
+                                          scenarioSpillDir)
+                print('  %-14s %8d recv() calls  %.3f seconds' %
+                      ('SocketReader:' if useReader else 'plain socket:',
+                       recvCalls, duration))
+    finally:
+        shutil.rmtree(spillDir)
+
+
+if __name__ == '__main__':
+    main()
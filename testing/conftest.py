@@ -0,0 +1,6 @@
+import sys
+
+collect_ignore = []
+if sys.version_info < (3, 5):
+    # async/await syntax is not available in older Python versions
+    collect_ignore.append('test_rasync.py')
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Unittesting module for the asyncio connector (rasync)
+"""
+import asyncio
+###
+import numpy
+import py
+###
+from pyRserve import rasync
+from pyRserve.rexceptions import REvalError, PyRserveClosed
+###
+from .testtools import start_pyRserve, compareArrays, RPORT
+
+
+def setup_module(module):
+    module.rProc = start_pyRserve()
+
+
+def teardown_module(module):
+    try:
+        module.rProc.terminate()
+    except AttributeError:
+        # probably Rserve process did not startup so the rProc object is
+        # not available.
+        pass
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def test_eval():
+    async def _test():
+        conn = await rasync.connectAsync(port=RPORT)
+        assert await conn.eval('1+1') == 2.0
+        assert compareArrays(await conn.eval('c(1, 2)'),
+                             numpy.array([1., 2.]))
+        assert await conn.eval('a <- 1', void=True) is None
+        await conn.close()
+        assert conn.isClosed
+    run(_test())
+
+
+def test_set_and_call():
+    async def _test():
+        conn = await rasync.connectAsync(port=RPORT)
+        await conn.setRexp('v', [1, 2, 3])
+        assert await conn.getRexp('v') == [1, 2, 3]
+        await conn.voidEval('ident <- function(v) { v }')
+        assert await conn.callFunc('ident', 'abc') == 'abc'
+        assert await conn.callFunc('seq', 1, 5, by=2.0) is not None
+        await conn.close()
+    run(_test())
+
+
+def test_eval_error():
+    async def _test():
+        conn = await rasync.connectAsync(port=RPORT)
+        with py.test.raises(REvalError):
+            await conn.eval('x_undefined_')
+        # the connection still works:
+        assert await conn.eval('1') == 1
+        await conn.close()
+        with py.test.raises(PyRserveClosed):
+            await conn.eval('1')
+    run(_test())
+
+
+def test_concurrent_connections():
+    async def _test():
+        conns = await asyncio.gather(
+            *[rasync.connectAsync(port=RPORT) for _ in range(4)])
+        results = await asyncio.gather(
+            *[conn.eval('%d * 2' % idx) for idx, conn in enumerate(conns)])
+        assert results == [0., 2., 4., 6.]
+        for conn in conns:
+            await conn.close()
+    run(_test())
+
+
+def test_oob_coroutine_callback():
+    async def _test():
+        collect = []
+
+        async def callback(data, code=0):
+            collect.append(data)
+            return 5
+
+        conn = await rasync.connectAsync(port=RPORT, oobCallback=callback)
+        assert await conn.eval('self.oobMessage("foo")') == 5
+        assert collect == ['foo']
+        await conn.close()
+    run(_test())
+
+
+def test_cancelled_call_closes_connection():
+    async def _test():
+        conn = await rasync.connectAsync(port=RPORT)
+        with py.test.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(conn.eval('Sys.sleep(1); 1'), 0.1)
+        # the response is still pending, so the connection is unusable:
+        assert conn.isClosed
+        with py.test.raises(PyRserveClosed):
+            await conn.eval('2')
+    run(_test())
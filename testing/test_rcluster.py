@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Unittesting module for rcluster
+"""
+import threading
+import time
+###
+import py
+###
+import pyRserve
+from pyRserve import rcluster
+from pyRserve.rexceptions import RConnectionRefused, REvalError, \
+    RPoolExhausted
+###
+from .testtools import start_pyRserve, RPORT
+
+PORTS = [RPORT, RPORT + 1]
+DEAD_PORT = RPORT + 2  # no Rserve is listening here
+
+
+def setup_module(module):
+    module.rProcs = [start_pyRserve(port=port) for port in PORTS]
+
+
+def teardown_module(module):
+    for rProc in getattr(module, 'rProcs', []):
+        rProc.terminate()
+
+
+def test_round_robin():
+    c = pyRserve.cluster([('', port) for port in PORTS],
+                         policy=rcluster.ROUND_ROBIN, connectionsPerHost=1)
+    try:
+        ports = []
+        for _ in range(4):
+            with c.connection() as conn:
+                ports.append(conn.port)
+        assert ports == PORTS * 2
+        assert c.eval('1+1') == 2
+        assert c.callFunc('sum', [1, 2, 3]) == 6
+    finally:
+        c.close()
+
+
+def test_least_outstanding():
+    c = pyRserve.cluster([('', port) for port in PORTS], connectionsPerHost=3)
+    ports = []
+
+    def work():
+        with c.connection() as conn:
+            ports.append(conn.port)
+            conn.voidEval('Sys.sleep(0.5)')
+    try:
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+            # let every thread pick its connection before the next one starts
+            time.sleep(0.1)
+        for thread in threads:
+            thread.join()
+        assert sorted(ports) == sorted(PORTS * 2)
+    finally:
+        c.close()
+
+
+def test_unreachable_host_is_marked_down():
+    c = pyRserve.cluster([('', DEAD_PORT), ('', RPORT)],
+                         policy=rcluster.ROUND_ROBIN, retryInterval=0.5)
+    try:
+        for _ in range(3):
+            with c.connection() as conn:
+                assert conn.port == RPORT
+        assert not c.endpoints[0].isUp
+        assert c.endpoints[1].isUp
+        # the host is probed again after retryInterval:
+        time.sleep(0.6)
+        assert c.eval('1') == 1
+        assert not c.endpoints[0].isUp
+    finally:
+        c.close()
+
+
+def test_no_host_reachable():
+    c = pyRserve.cluster([('', DEAD_PORT)])
+    py.test.raises(RConnectionRefused, c.eval, '1')
+    c.close()
+
+
+def test_failing_init_does_not_leak_outstanding_calls():
+    c = pyRserve.cluster([('', RPORT)], init='stop("init failed")')
+    try:
+        py.test.raises(REvalError, c.eval, '1')
+        assert c.endpoints[0].outstanding == 0
+        # other errors than unreachable hosts don't mark the host as down:
+        assert c.endpoints[0].isUp
+    finally:
+        c.close()
+
+
+def test_busy_instances():
+    c = pyRserve.cluster([('', port) for port in PORTS],
+                         policy=rcluster.ROUND_ROBIN, connectionsPerHost=1)
+    try:
+        with c.connection() as conn1:
+            # the next instance is used while the first one is busy:
+            with c.connection() as conn2:
+                assert conn2.port != conn1.port
+                # all instances are busy:
+                start = time.time()
+                with py.test.raises(RPoolExhausted):
+                    with c.connection(timeout=0.2):
+                        pass
+                assert time.time() - start < 1
+                assert [e.outstanding for e in c.endpoints] == [1, 1]
+            # the connection released by any instance is taken:
+            with c.connection(timeout=1) as conn:
+                assert conn is conn2
+    finally:
+        c.close()
+
+
+def test_map():
+    res = pyRserve.map('function(x) x^2', range(10), connections=2,
+                       port=RPORT)
+    assert res == [float(x ** 2) for x in range(10)]
+    res = pyRserve.map('sqrt', [4, 9, 16], connections=2, chunkSize=1,
+                       port=RPORT)
+    assert res == [2.0, 3.0, 4.0]
+    assert pyRserve.map('sqrt', [], port=RPORT) == []
+
+
+def test_map_with_cluster():
+    c = pyRserve.cluster([('', port) for port in PORTS])
+    try:
+        res = pyRserve.map('function(x) x + 1', range(20), connections=4,
+                           pool=c)
+        assert res == [float(x + 1) for x in range(20)]
+        # the cluster is left open for further use:
+        assert c.eval('1') == 1
+    finally:
+        c.close()
@@ -3,15 +3,20 @@
 Unittesting module for rparser
 """
 import datetime
+import os
+import tempfile
 ###
 import numpy
 import py
 ###
-from pyRserve import rtypes, rserializer, rconn, rparser
+import pyRserve
+from pyRserve import rtypes, rserializer, rconn, rparser, rexceptions
 from pyRserve.rconn import RVarProxy, OOBCallback
 from pyRserve.misc import PY3
-from pyRserve.rexceptions import REvalError
-from pyRserve.taggedContainers import TaggedList, TaggedArray
+from pyRserve.rexceptions import REvalError, RPoolExhausted, RBatchEvalError, \
+    PyRserveTimeout
+from pyRserve.taggedContainers import TaggedList, TaggedArray, \
+    LazyTaggedList, _LazyValue, Factor
 ###
 from .testtools import start_pyRserve, compareArrays, RPORT
 
@@ -330,6 +335,211 @@ def test_tagged_lists():
     # conn.r.ident(TaggedList([("n","Fred"), 2.0, ("c_ages", 5.5)])
 
 
+def test_data_frames():
+    """
+    With dataFrames=True data.frames are returned as pandas DataFrames
+    """
+    pandas = py.test.importorskip('pandas')
+    res = conn.eval('data.frame(a=1:3, b=c(1.5, 2.5, NA), '
+                    'f=factor(c("x", NA, "x"), levels=c("x", "y")), '
+                    'stringsAsFactors=FALSE)', dataFrames=True)
+    assert isinstance(res, pandas.DataFrame)
+    assert list(res.columns) == ['a', 'b', 'f']
+    assert isinstance(res.index, pandas.RangeIndex)
+    assert len(res.index) == 3
+    assert list(res['a']) == [1, 2, 3]
+    assert res['b'][1] != res['b'][1]  # NaN
+    assert list(res['f'].cat.categories) == ['x', 'y']
+    assert list(res['f'].cat.codes) == [0, -1, 0]
+
+    res = conn.eval('data.frame(s=c("u", "v"), row.names=c("r1", "r2"), '
+                    'stringsAsFactors=FALSE)', dataFrames=True)
+    assert list(res.index) == ['r1', 'r2']
+    assert list(res['s']) == ['u', 'v']
+
+    # single rows are not converted into scalars:
+    res = conn.eval('data.frame(a=1)', dataFrames=True)
+    assert res.shape == (1, 1)
+
+    # list columns become object columns holding one item per row:
+    res = conn.eval('data.frame(a=1:2, l=I(list(1.5, c("x", "y"))))',
+                    dataFrames=True)
+    assert res.shape == (2, 2)
+    assert res['l'][0] == 1.5
+    assert list(res['l'][1]) == ['x', 'y']
+
+    # by default data.frames are still returned as TaggedLists:
+    assert isinstance(conn.eval('data.frame(a=1:3)'), TaggedList)
+
+    # compact row names contain NA, but must not be masked:
+    df = pandas.DataFrame({'x': numpy.array([1, 2], numpy.int32)})
+    res = rparser.rparse(rserializer.rSerializeResponse(df),
+                         dataFrames=True, na='mask')
+    assert isinstance(res.index, pandas.RangeIndex)
+    assert list(res['x']) == [1, 2]
+    res = conn.eval('data.frame(x=c(1L, NA))', dataFrames=True, na='mask')
+    assert len(res.index) == 2
+    assert res['x'].isnull().tolist() == [False, True]
+
+
+def test_data_frame_columns_share_message_buffer():
+    """
+    Numeric columns of data.frames remain views onto the received message
+    """
+    pandas = py.test.importorskip('pandas')
+    df = pandas.DataFrame({'x': [1.5, 2.5], 'y': [3.5, 4.5],
+                           'i': numpy.array([1, 2], numpy.int32),
+                           's': ['a', 'b']})
+    message = bytearray(rserializer.rSerializeResponse(df))
+    res = rparser.rparse(message, dataFrames=True)
+    buf = numpy.frombuffer(message, numpy.uint8)
+    for name in ['x', 'y', 'i']:
+        assert numpy.shares_memory(res[name].values, buf)
+
+
+def test_serialize_data_frames():
+    """
+    Structured arrays and pandas DataFrames are sent as data.frames, pandas
+    Categoricals as factors
+    """
+    rec = numpy.array([(1, 2.5), (2, 3.5)], dtype=[('i', 'i4'), ('x', 'f8')])
+    res = rparser.rparse(rserializer.rSerializeResponse(rec))
+    assert res.keys == ['i', 'x']
+    assert compareArrays(res['i'], numpy.array([1, 2]))
+    assert compareArrays(res['x'], numpy.array([2.5, 3.5]))
+    conn.r.rec = rec
+    assert conn.eval('class(rec)') == 'data.frame'
+    assert conn.eval('nrow(rec)') == 2
+
+    pandas = py.test.importorskip('pandas')
+    df = pandas.DataFrame({
+        'a': numpy.arange(3),
+        'b': [1.5, 2.5, numpy.nan],
+        's': ['u', 'v', 'w'],
+        'f': pandas.Categorical(['x', None, 'x'], categories=['x', 'y']),
+        'o': pandas.Categorical(['lo', 'hi', 'lo'], categories=['lo', 'hi'],
+                                ordered=True)})
+    res = rparser.rparse(rserializer.rSerializeResponse(df), dataFrames=True)
+    pandas.testing.assert_frame_equal(res, df, check_dtype=False)
+
+    conn.r.df = df
+    assert conn.eval('class(df)') == 'data.frame'
+    assert list(conn.eval('row.names(df)')) == ['1', '2', '3']
+    assert compareArrays(conn.eval('levels(df$f)'), numpy.array(['x', 'y']))
+    assert conn.eval('is.na(df$f[2])')
+    assert conn.eval('is.ordered(df$o)')
+
+    conn.r.df = df.set_index(pandas.Index(['r1', 'r2', 'r3']))
+    assert list(conn.eval('row.names(df)')) == ['r1', 'r2', 'r3']
+
+    # missing values of strings and of pandas' nullable types become NA,
+    # float32 columns are sent as doubles:
+    df = pandas.DataFrame({
+        's': ['u', None, numpy.nan],
+        'i': pandas.array([1, None, 3], dtype='Int64'),
+        'f': numpy.array([1.5, 2.5, 3.5], numpy.float32)})
+    res = rparser.rparse(rserializer.rSerializeResponse(df), dataFrames=True)
+    assert list(res['s']) == ['u', None, None]
+    assert list(res['i'][[0, 2]]) == [1, 3]
+    assert res['f'].dtype == numpy.float64
+    conn.r.df = df
+    assert compareArrays(conn.eval('is.na(df$s)'),
+                         numpy.array([False, True, True]))
+    assert compareArrays(conn.eval('is.na(df$i)'),
+                         numpy.array([False, True, False]))
+
+    # unsupported column types are reported with the name of the column:
+    df = pandas.DataFrame({'d': pandas.to_datetime(['2020-01-01'])})
+    exc = py.test.raises(NotImplementedError,
+                         rserializer.rSerializeResponse, df)
+    assert '"d"' in str(exc.value)
+
+
+def test_factors():
+    """
+    Factors are returned as Factor arrays of their integer codes
+    """
+    res = conn.eval('factor(c("b", NA, "a", "b"))')
+    assert isinstance(res, Factor)
+    assert compareArrays(res.codes,
+                         numpy.array([2, rtypes.INT_NA, 1, 2], numpy.int32))
+    assert list(res.levels) == ['a', 'b']
+    assert list(res.astype(str)) == ['b', '', 'a', 'b']
+    assert not res.ordered
+    assert conn.eval('ordered(c("lo", "hi"), levels=c("lo", "hi"))').ordered
+    # integer vectors with levels but without the factor class aren't
+    # factors:
+    res = conn.eval('structure(1:3, levels=c("a", "b"))')
+    assert not isinstance(res, Factor)
+    assert list(res.attr['levels']) == ['a', 'b']
+
+    # codes are not copied from the received message:
+    msg = rserializer.rSerializeResponse(res)
+    parsed = rparser.rparse(bytearray(msg))
+    assert isinstance(parsed, Factor)
+    assert not parsed.codes.flags.owndata
+
+    # Factors are sent back as factors:
+    conn.r.fac = res
+    assert conn.eval('is.factor(fac)')
+    assert compareArrays(conn.eval('as.character(fac[c(1, 3)])'),
+                         numpy.array(['b', 'a']))
+
+
+def test_na_mask():
+    """
+    With na='mask' NA values are masked in integer, double, logical and
+    string arrays. Masked arrays are sent to R with NA values at masked
+    positions. By default NA strings are returned as None.
+    """
+    for arr in [numpy.ma.MaskedArray([1.5, 2.5, 3.5], mask=[0, 1, 0]),
+                numpy.ma.MaskedArray(numpy.array([1, 2, 3], numpy.int32),
+                                     mask=[1, 0, 0]),
+                numpy.ma.MaskedArray([True, False], mask=[0, 1])]:
+        msg = rserializer.rSerializeResponse(arr)
+        res = rparser.rparse(bytearray(msg), na='mask')
+        assert isinstance(res, numpy.ma.MaskedArray)
+        assert (res.mask == arr.mask).all()
+        assert (res.compressed() == arr.compressed()).all()
+        assert not res.data.flags.owndata
+    arr = numpy.ma.MaskedArray(['a', 'b', 'c'], mask=[0, 1, 0])
+    msg = rserializer.rSerializeResponse(arr)
+    res = rparser.rparse(msg)
+    assert list(res) == ['a', None, 'c']
+    res = rparser.rparse(msg, na='mask')
+    assert list(res.mask) == [False, True, False]
+    assert list(res.compressed()) == ['a', 'c']
+    # NaN is not NA:
+    msg = rserializer.rSerializeResponse(numpy.array([numpy.nan, 1.0]))
+    res = rparser.rparse(msg, na='mask')
+    assert numpy.isnan(res[0]) and not res.mask.any()
+    py.test.raises(ValueError, rparser.rparse, msg, na='unknown')
+
+    res = conn.eval('c(1L, NA, 3L)', na='mask')
+    assert list(res.mask) == [False, True, False]
+    res = conn.eval('c(1.5, NA, NaN)', na='mask')
+    assert list(res.mask) == [False, True, False]
+    res = conn.eval('c(TRUE, NA)', na='mask')
+    assert list(res.mask) == [False, True]
+    assert conn.eval('NA_integer_', na='mask') is None
+    # arrays without NA values are masked arrays as well:
+    assert isinstance(conn.eval('c(1, 2)', na='mask'), numpy.ma.MaskedArray)
+    res = conn.eval('c("a", NA)', na='mask')
+    assert list(res.mask) == [False, True]
+    # by default NA values remain in the data, NA strings become None:
+    assert compareArrays(conn.eval('c(1L, NA)'),
+                         numpy.array([1, rtypes.INT_NA]))
+    assert list(conn.eval('c("a", NA)')) == ['a', None]
+    assert conn.eval('NA_character_') is None
+
+    conn.r.masked = numpy.ma.MaskedArray([1.5, 2.5, 3.5], mask=[0, 1, 0])
+    assert compareArrays(conn.eval('is.na(masked)'),
+                         numpy.array([False, True, False]))
+    conn.r.masked = numpy.ma.MaskedArray([True, False], mask=[1, 0])
+    assert compareArrays(conn.eval('is.na(masked)'),
+                         numpy.array([True, False]))
+
+
 def test_vector_expression():
     """
     Tests for typecode 0x1a XT_VECTOR_EXP - returns the expression content
@@ -542,6 +752,92 @@ def test_serialize_DT_INT():
     assert hexd == res
 
 
+def test_serialize_large_data_header():
+    """data blocks longer than 2**24 bytes need large (8 bytes) headers"""
+    arr = numpy.arange(3 * 10**6, dtype=float)
+    res = rserializer.rSerializeResponse(arr)
+    # DT_SEXP header with DT_LARGE flag and 7 bytes length:
+    assert res[16:24] == b'\x4a\x08\x36\x6e\x01\x00\x00\x00'
+    # XT_ARRAY_DOUBLE header with XT_LARGE flag:
+    assert res[24:32] == b'\x61\x00\x36\x6e\x01\x00\x00\x00'
+    assert (rparser.rparse(res, atomicArray=True) == arr).all()
+
+    # large data within a list, where the header size can only be determined
+    # after the data has been serialized:
+    lst = TaggedList([('a', numpy.arange(5 * 10**6)), ('b', 'x')])
+    res = rserializer.rSerializeResponse(lst)
+    assert res[16] == 0x4a if PY3 else ord(res[16]) == 0x4a
+    result = rparser.rparse(res, atomicArray=True)
+    assert (result['a'] == lst['a']).all()
+    assert result['b'] == 'x'
+
+
+def test_serialize_array_without_copy():
+    """
+    Array data is sent from the array's own buffer if it is in Fortran order
+    already, the socket receives the same data as returned otherwise
+    """
+    import socket
+    import threading
+    arr = numpy.arange(10**6, dtype=float).reshape(1000, 1000, order='F')
+    s = rserializer.RSerializer(rtypes.CMD_setSEXP)
+    s.serialize('x', dtTypeCode=rtypes.DT_STRING)
+    s.serialize(arr)
+    assert any(numpy.shares_memory(chunk, arr) for chunk in s._chunks
+               if isinstance(chunk, numpy.ndarray))
+
+    expected = rserializer.rAssign('x', arr)
+    sender, receiver = socket.socketpair()
+    received = []
+
+    def receive():
+        numBytes = 0
+        while numBytes < len(expected):
+            received.append(receiver.recv(1024 * 1024))
+            numBytes += len(received[-1])
+    thread = threading.Thread(target=receive)
+    thread.start()
+    try:
+        rserializer.rAssign('x', arr, fp=sender)
+        thread.join()
+        assert b''.join(received) == expected
+    finally:
+        sender.close()
+        receiver.close()
+
+
+def test_serialize_streaming():
+    """
+    The size of a message is computed in advance, so it is written in blocks
+    while being serialized. Errors are detected before anything is written.
+    """
+    class Writer(object):
+        def __init__(self):
+            self.blocks = []
+
+        def write(self, data):
+            self.blocks.append(bytes(data))
+
+    data = [numpy.arange(10**5, dtype=float) for _ in range(30)] + \
+        [TaggedList([('a', 'x' * 10**5), ('b', [1, 2.5, None])])]
+    writer = Writer()
+    rserializer.rAssign('x', data, fp=writer)
+    assert len(writer.blocks) > 1
+    assert b''.join(writer.blocks) == rserializer.rAssign('x', data)
+
+    writer = Writer()
+    data = [numpy.arange(10**6, dtype=float), numpy.array([2**40])]
+    py.test.raises(ValueError, rserializer.rAssign, 'x', data, fp=writer)
+    assert writer.blocks == []
+
+
+def test_very_large_array_roundtrip():
+    arr = numpy.arange(3 * 10**6, dtype=float)
+    conn.r.largeArr = arr
+    assert (conn.r.largeArr == arr).all()
+    assert conn.eval('length(largeArr)') == arr.size
+
+
 def test_serialize_unsupported_object_raises_exception():
     # datetime objects are not yet supported, so an exception can be expected
     py.test.raises(NotImplementedError, conn.r.ident, datetime.date.today())
@@ -622,3 +918,484 @@ def test_help_message():
     # remove the extra underscore formatting characters from the help message:
     help_msg = help_msg.replace('_\x08', '')
     assert help_msg.startswith('Apply a Function over a List or Vector')
+
+
+#######################
+# connection pool
+
+def test_pool_connections():
+    """Connections handed out by a pool are initialized and reusable"""
+    p = pyRserve.pool(port=RPORT, size=2, init='poolvar <- 42')
+    try:
+        with p.connection() as c1:
+            with p.connection() as c2:
+                assert c1 is not c2
+                assert c1.r.poolvar == 42
+                assert c2.r.poolvar == 42
+        # both connections have been returned to the pool:
+        with p.connection() as c:
+            assert c in (c1, c2)
+    finally:
+        p.close()
+    assert p.isClosed
+
+
+def test_pool_replaces_dead_connection():
+    """A connection which died while it was in use is replaced by a new one"""
+    p = pyRserve.pool(port=RPORT, size=1)
+    try:
+        with p.connection() as c:
+            c.close()
+        with p.connection() as c2:
+            assert c2 is not c
+            assert c2.r('1') == 1
+    finally:
+        p.close()
+
+
+def test_pool_exhausted():
+    p = pyRserve.pool(port=RPORT, size=1)
+    try:
+        with p.connection():
+            py.test.raises(RPoolExhausted, p.acquire, timeout=0.1)
+    finally:
+        p.close()
+
+
+def test_server_capabilities():
+    """The ID string sent by Rserve is parsed when connecting"""
+    assert conn.capabilities.protocol == 'QAP1'
+    assert conn.capabilities.versionNumber >= 103
+
+    caps = rconn.RserveCapabilities.fromIdString(
+        b'Rsrv0103QAP1\r\n\r\nARucKab-TLS\0----\r\n')
+    assert caps.version == '0103'
+    assert caps.attributes == ['ARuc', 'Kab-', 'TLS']
+    assert caps.authRequired and caps.unixCryptAuth
+    assert not caps.plainTextAuth
+    assert caps.cryptKey == 'ab'
+    assert caps.tls
+
+
+def test_eval_many():
+    """Several statements are sent to Rserve in one go"""
+    res = conn.evalMany(['1+1', ('batchvar', [1, 2]), 'batchvar',
+                         'length(batchvar)'])
+    assert res == [2.0, None, [1, 2], 1]
+    assert conn.evalMany(['a <- 1', 'b <- 2'], void=True) == [None, None]
+
+
+def test_eval_many_with_errors():
+    """Errors are mapped back to the statements which caused them"""
+    try:
+        conn.evalMany(['1', 'x_undefined_', '3'])
+    except RBatchEvalError as msg:
+        assert [idx for idx, statement, error in msg.errors] == [1]
+        assert msg.errors[0][1] == 'x_undefined_'
+        assert str(msg.errors[0][2]) == \
+            "Error: object 'x_undefined_' not found"
+        assert msg.results == [1, None, 3]
+    else:
+        assert False, 'RBatchEvalError not raised'
+    # check that the connection still works:
+    assert conn.r('1') == 1
+
+    # with trapped errors every failed statement gets its own message:
+    exc = py.test.raises(RBatchEvalError, conn.evalMany,
+                         ['stop("first")', '2', 'stop("second")'],
+                         trapErrors=True).value
+    assert [idx for idx, statement, error in exc.errors] == [0, 2]
+    assert 'first' in str(exc.errors[0][2])
+    assert 'second' in str(exc.errors[1][2])
+    assert exc.errors[1][2].classes[-1] == 'condition'
+    assert exc.results == [None, 2, None]
+
+    # statements exceeding the window size are sent in several portions:
+    res = conn.evalMany(['%d + 0 # %s' % (idx, 'x' * 100)
+                         for idx in range(2000)])
+    assert res == list(range(2000))
+
+
+def test_unix_socket_connection():
+    """Connect to an Rserve listening on a unix domain socket"""
+    path = os.path.join(tempfile.mkdtemp(), 'rserve.sock')
+    rProc = start_pyRserve(unixSocket=path)
+    try:
+        c = rconn.connect(unixSocket=path)
+        assert c.r('1+1') == 2
+        assert 'unix socket' in repr(c)
+        c.close()
+    finally:
+        rProc.terminate()
+
+
+#######################
+# detached sessions
+
+def test_detach_and_attach_session():
+    """Data in a detached session is still available after resuming it"""
+    c = rconn.connect(port=RPORT)
+    c.r.detachedvar = numpy.array([1.5, 2.5])
+    key = c.detach()
+    assert c.isClosed
+    assert len(key.key) == 32
+
+    c = pyRserve.attach(key)
+    assert compareArrays(c.r.detachedvar, numpy.array([1.5, 2.5]))
+    c.close()
+
+
+def test_detached_void_eval():
+    c = rconn.connect(port=RPORT)
+    key = c.detachedVoidEval('detachedres <- sum(1:10)')
+    assert c.isClosed
+
+    c = pyRserve.attach(key)
+    assert c.r.detachedres == 55
+    c.close()
+
+
+def test_file_transfer():
+    fileName = os.path.join(tempfile.mkdtemp(), 'data.bin')
+    data = os.urandom(100000)
+    with conn.open(fileName, 'wb', bufferSize=30000) as f:
+        assert f.write(data) == len(data)
+    assert conn.eval('file.info("%s")$size' % fileName) == len(data)
+
+    with conn.open(fileName, 'rb', bufferSize=30000) as f:
+        assert f.read(10) == data[:10]
+        # reads return at most one chunk:
+        assert f.read(50000) == data[10:30010]
+        assert f.read() == data[30010:]
+        assert f.read() == b''
+        py.test.raises(IOError, f.write, b'abc')
+
+    # files which are not closed explicitly are not closed in Rserve by the
+    # garbage collector, since it might run during another request:
+    f = conn.open(fileName, 'rb')
+    f.__del__()
+    assert f.closed
+    assert conn.eval('1+1') == 2
+
+    conn.removeFile(fileName)
+    assert not conn.eval('file.exists("%s")' % fileName)
+    py.test.raises(rexceptions.RResponseError, conn.open, fileName, 'rb')
+    # connection is still usable:
+    assert conn.eval('1+1') == 2
+
+
+def test_packed_function_call():
+    c = rconn.connect(port=RPORT, packCallArgs=True)
+    try:
+        c.voidEval('packedFunc <- function(a, b, c=1, d=NULL) '
+                   'list(a, b, c, is.null(d))')
+        c.r.pv = 10
+        res = c.r.packedFunc(numpy.array([1, 2]), c.ref.pv, d=None, c='x')
+        assert compareArrays(res[0], numpy.array([1, 2]))
+        assert res[1:] == [10.0, 'x', True]
+        # no temporary variables are left behind:
+        assert not c.eval('exists(".pyRserveArgs_")')
+        assert not c.eval('exists("arg_0_")')
+        # errors of the function itself are reported:
+        py.test.raises(REvalError, c.r.packedFunc, 1)
+        assert c.r.sum([1, 2, 3]) == 6
+        # functions are called from the global environment:
+        c.r.assign('packedVar', 5)
+        assert c.eval('packedVar') == 5
+    finally:
+        c.close()
+
+    # errors of packed calls are trapped like those of other calls:
+    c = rconn.connect(port=RPORT, packCallArgs=True, trapErrors=True)
+    try:
+        exc = py.test.raises(REvalError, c.r.log, -1, base='e').value
+        assert 'error' in exc.classes
+        assert exc.call is not None
+        # the reported call neither contains the function's definition nor
+        # all values of its arguments:
+        c.voidEval('failingFunc <- function(x) { stop("failed") }')
+        exc = py.test.raises(REvalError, c.r.failingFunc,
+                             numpy.arange(10000.)).value
+        assert exc.call.startswith('failingFunc(')
+        assert len(exc.call) < 100
+        with py.test.warns(pyRserve.RWarning):
+            assert c.callFunc('sqrt', -1) != c.callFunc('sqrt', -1)  # NaN
+    finally:
+        c.close()
+
+
+def test_serialize_tagged_list_with_empty_keys():
+    res = rserializer.rSerializeResponse(TaggedList([('a', 1), 2]))
+    assert rparser.rparse(res) == TaggedList([('a', 1), 2])
+
+
+def test_name_cache():
+    c = rconn.connect(port=RPORT, cacheNames=True)
+    try:
+        c.voidEval('cachedFunc <- function(x) x')
+        assert isinstance(c.r.cachedFunc, rconn.RFuncProxy)
+        assert c.lookupName('cachedFunc') == rconn.NAME_FUNCTION
+        assert c._nameCache['cachedFunc'] == rconn.NAME_FUNCTION
+        assert c.lookupName('noSuchName') is None
+        py.test.raises(NameError, getattr, c.r, 'noSuchName')
+
+        # assigning a variable updates the cache:
+        c.r.cachedFunc = 5
+        assert c._nameCache['cachedFunc'] == rconn.NAME_VARIABLE
+        assert c.r.cachedFunc == 5
+
+        # evaluating R code resets the cache:
+        c.voidEval('cachedFunc <- function(x) x')
+        assert 'cachedFunc' not in c._nameCache
+        assert isinstance(c.r.cachedFunc, rconn.RFuncProxy)
+
+        c.refreshNameCache()
+        assert c._nameCache['sapply'] == rconn.NAME_FUNCTION
+        assert c._nameCache['cachedFunc'] == rconn.NAME_FUNCTION
+        assert c._nameCache['pi'] == rconn.NAME_VARIABLE
+        assert isinstance(c.r.t.test, rconn.RFuncProxy)
+
+        helpText = c.r.sapply.__doc__
+        assert c._helpCache['sapply'] == helpText
+    finally:
+        c.close()
+
+    # without caching assigned names aren't collected:
+    conn.r.uncachedVar = 1
+    assert 'uncachedVar' not in conn._nameCache
+
+
+def test_trap_errors():
+    c = rconn.connect(port=RPORT, trapErrors=True)
+    try:
+        assert c.eval('1 + 1') == 2
+        assert c.eval('"a\\"b"') == 'a"b'
+        c.voidEval('trappedVar <- 5')
+        assert c.r.trappedVar == 5
+
+        try:
+            c.eval('log(-1:-2, base="e")')
+        except REvalError as exc:
+            assert exc.call == 'log(-1:-2, base = "e")'
+            assert 'error' in exc.classes
+            assert str(exc).startswith('Error in log(-1:-2, base = "e") : ')
+        else:
+            assert False, 'REvalError expected'
+
+        c.voidEval('condFunc <- function() stop(structure(class=c("myError", '
+                   '"error", "condition"), list(message="failed", '
+                   'call=NULL)))')
+        exc = py.test.raises(REvalError, c.r.condFunc).value
+        assert str(exc) == 'Error: failed'
+        assert exc.call is None
+        assert exc.classes == ['myError', 'error', 'condition']
+
+        with py.test.warns(pyRserve.RWarning):
+            assert c.eval('{warning("careful"); 3}') == 3
+
+        # trapping can also be turned off for single calls:
+        exc = py.test.raises(REvalError, c.eval, 'stop("oops")',
+                             trapErrors=False).value
+        assert 'oops' in str(exc)
+    finally:
+        c.close()
+
+
+def test_resync_after_parse_error():
+    """
+    After a failed parsing attempt the rest of the message has to be consumed
+    from the socket, even if it arrives late, but not any following message
+    """
+    import socket
+    import threading
+    import time
+    bad = bytearray(rserializer.rSerializeResponse(numpy.arange(10000)))
+    bad[20] = 0x3f  # unknown XT type code
+    good = rserializer.rSerializeResponse('abc')
+    sender, receiver = socket.socketpair()
+
+    def sendDelayed():
+        time.sleep(0.2)
+        sender.sendall(bytes(bad[100:]) + good)
+    sender.sendall(bytes(bad[:100]))
+    thread = threading.Thread(target=sendDelayed)
+    thread.start()
+    try:
+        py.test.raises(Exception, rparser.rparse, receiver)
+        assert rparser.rparse(receiver) == 'abc'
+    finally:
+        thread.join()
+        sender.close()
+        receiver.close()
+
+
+def test_parse_array_from_socket_without_copy():
+    """
+    Messages are received as a whole into one buffer, numeric arrays are
+    just views onto it
+    """
+    import socket
+    import threading
+    arr = numpy.arange(10**6, dtype=float)
+    msg = rserializer.rSerializeResponse(arr)
+    sender, receiver = socket.socketpair()
+
+    def sendFragmented():
+        for idx in range(0, len(msg), 100000):
+            sender.sendall(msg[idx:idx + 100000])
+    thread = threading.Thread(target=sendFragmented)
+    thread.start()
+    try:
+        result = rparser.rparse(receiver, atomicArray=True)
+        assert (result == arr).all()
+        assert not result.flags.owndata
+    finally:
+        thread.join()
+        sender.close()
+        receiver.close()
+
+
+def test_socket_reader():
+    """
+    Several small messages are received with a single recv() call, data of
+    the following message remains buffered in the reader
+    """
+    import socket
+    import threading
+    messages = [rserializer.rSerializeResponse(value)
+                for value in (1, 'abc', [1, 2])]
+    sender, receiver = socket.socketpair()
+    try:
+        sender.sendall(b''.join(messages))
+        reader = rparser.SocketReader(receiver)
+        assert rparser.rparse(reader) == 1
+        assert reader.buffered == len(messages[1]) + len(messages[2])
+        assert rparser.rparse(reader) == 'abc'
+        assert rparser.rparse(reader) == [1, 2]
+        assert reader.buffered == 0
+        assert reader.recvCalls == 1
+
+        # large data bypasses the buffer:
+        arr = numpy.arange(10**5, dtype=float)
+        thread = threading.Thread(
+            target=sender.sendall,
+            args=(rserializer.rSerializeResponse(arr),))
+        thread.start()
+        assert (rparser.rparse(reader, atomicArray=True) == arr).all()
+        thread.join()
+    finally:
+        sender.close()
+        receiver.close()
+
+
+def test_lazy_parsing():
+    """
+    In lazy mode items of lists are only parsed when accessed
+    """
+    coefficients = numpy.array([1.5, -0.25])
+    fit = TaggedList([('coefficients', coefficients),
+                      ('residuals', numpy.arange(10**5, dtype=float)),
+                      ('model', TaggedList([('x', 'abc'), ('y', [1, 2])]))])
+    msg = rserializer.rSerializeResponse(fit)
+    res = rparser.rparse(bytearray(msg), lazy=True)
+    assert isinstance(res, LazyTaggedList)
+    assert res.keys == ['coefficients', 'residuals', 'model']
+    assert (res['coefficients'] == coefficients).all()
+    assert isinstance(res._values[1], _LazyValue)
+    assert isinstance(res[2], LazyTaggedList)
+    assert res[2]['x'] == 'abc'
+    # unnamed lists are returned as LazyTaggedLists as well:
+    assert isinstance(res[2][1], LazyTaggedList)
+    assert list(res[2][1]) == [1, 2]
+    assert res[2] == TaggedList([('x', 'abc'), ('y', res[2][1])])
+    assert (res['residuals'] == rparser.rparse(msg)['residuals']).all()
+    assert isinstance(res._values[1], numpy.ndarray)
+    # the values attribute doesn't contain any placeholders:
+    res = rparser.rparse(bytearray(msg), lazy=True)
+    assert not any(isinstance(value, _LazyValue) for value in res.values)
+
+
+def test_spill_arrays_to_disk():
+    """
+    Large numeric arrays are received from the socket into memory-mapped
+    files when a spill directory is given
+    """
+    import socket
+    import threading
+    import shutil
+    large = numpy.arange(10**5, dtype=float)
+    small = numpy.arange(10, dtype=numpy.int32)
+    msg = rserializer.rSerializeResponse(TaggedList([('a', large),
+                                                     ('b', small)]))
+    spillDir = tempfile.mkdtemp()
+    sender, receiver = socket.socketpair()
+    thread = threading.Thread(target=sender.sendall, args=(msg,))
+    thread.start()
+    try:
+        res = rparser.rparse(rparser.SocketReader(receiver),
+                             spillDir=spillDir, spillThreshold=10**5)
+        assert isinstance(res['a'], numpy.memmap)
+        assert (res['a'] == large).all()
+        assert os.listdir(spillDir) == [os.path.basename(res['a'].filename)]
+        assert (numpy.load(res['a'].filename) == large).all()
+        assert not isinstance(res['b'], numpy.memmap)
+        assert (res['b'] == small).all()
+    finally:
+        thread.join()
+        sender.close()
+        receiver.close()
+        del res
+        shutil.rmtree(spillDir)
+
+    py.test.raises(ValueError, rparser.rparse, msg, lazy=True,
+                   spillDir=spillDir)
+
+
+def test_deadline():
+    c = rconn.connect(port=RPORT, timeout=10)
+    assert c.eval('1 + 1', deadline=5) == 2
+    py.test.raises(PyRserveTimeout, c.eval, 'Sys.sleep(5)', deadline=0.5)
+    assert c.isClosed
+    assert c.poisoned
+
+    c = rconn.connect(port=RPORT)
+    with c.deadline(5):
+        c.r.deadlineVar = 1
+        assert c.r.deadlineVar == 1
+    with py.test.raises(PyRserveTimeout):
+        with c.deadline(0.5):
+            c.callFunc('Sys.sleep', 5)
+    assert c.isClosed
+
+
+def test_deadline_covers_all_receives():
+    """
+    A response which arrives in small pieces can't exceed the deadline, even
+    though every single piece arrives in time
+    """
+    import socket
+    import threading
+    import time
+    from pyRserve.misc import monotonic
+    msg = rserializer.rSerializeResponse(numpy.arange(1000))
+    sender, receiver = socket.socketpair()
+
+    def sendSlowly():
+        try:
+            for pos in range(0, len(msg), 100):
+                sender.sendall(msg[pos:pos + 100])
+                time.sleep(0.05)
+        except socket.error:
+            pass
+    thread = threading.Thread(target=sendSlowly)
+    thread.start()
+    try:
+        reader = rparser.SocketReader(receiver, bufferSize=100)
+        reader.deadline = monotonic() + 0.3
+        start = monotonic()
+        py.test.raises(socket.timeout, rparser.rparse, reader)
+        assert monotonic() - start < 1
+    finally:
+        receiver.close()
+        thread.join()
+        sender.close()
@@ -1,7 +1,10 @@
 """
 unittests for classes from taggedContainers
 """
-from pyRserve.taggedContainers import TaggedList
+import numpy
+###
+from pyRserve.rtypes import INT_NA
+from pyRserve.taggedContainers import TaggedList, LazyTaggedList, Factor
 
 
 def test_TaggedList_init_emtpy():
@@ -62,3 +65,54 @@ def test_TaggedList_insert_with_key():
     assert len(t) == 3
     assert t.values == [1, 11, 22]
     assert t[0] == t['x'] == 1
+
+
+def test_LazyTaggedList():
+    created = []
+
+    def factory(value):
+        def create():
+            created.append(value)
+            return value
+        return create
+    t = LazyTaggedList(['a', '', 'c'], [factory(1), factory(2), factory(3)])
+    assert len(t) == 3
+    assert t['c'] == 3
+    assert created == [3]
+    # accessing the values creates all of them:
+    assert t.values == [1, 2, 3]
+    assert t.keys == ['a', None, 'c']
+    # comparison works in both directions:
+    other = TaggedList([('a', 1), 2, ('c', 3)])
+    assert t == other
+    assert other == t
+    assert TaggedList.__eq__(other, t)
+    t.append(d=4)
+    assert t.astuples()[-1] == ('d', 4)
+
+
+def test_Factor():
+    codes = numpy.array([1, 2, INT_NA, 1], numpy.int32)
+    f = Factor.new(codes, {'levels': numpy.array(['a', 'bb']),
+                           'class': numpy.array(['factor'])})
+    assert list(f.levels) == ['a', 'bb']
+    assert not f.ordered
+    assert f.codes.base is codes
+    assert list(f.astype(str)) == ['a', 'bb', '', 'a']
+    assert list(f.astype(object)) == ['a', 'bb', None, 'a']
+    assert f.astype(float)[1] == 2.0
+    # slices keep their levels:
+    assert list(f[1:].astype(str)) == ['bb', '', 'a']
+    # results of arithmetic and comparisons are plain arrays:
+    assert type(f * 2) is numpy.ndarray
+    assert list(f[[0, 1]] * 2) == [2, 4]
+    assert type(f == 1) is numpy.ndarray
+    assert f.max() == 2
+
+
+def test_Factor_ordered():
+    f = Factor.new(numpy.array([2, 1], numpy.int32),
+                   {'levels': numpy.array(['lo', 'hi']),
+                    'class': numpy.array(['ordered', 'factor'])})
+    assert f.ordered
+    assert list(f.astype(str)) == ['hi', 'lo']
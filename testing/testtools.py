@@ -20,14 +20,23 @@ HERE_PATH = os.path.dirname(os.path.realpath(__file__))
 RPORT = 6355
 
 
-def start_pyRserve():
-    """Setup connection to remote Rserve for unittesting"""
+def start_pyRserve(unixSocket=None, port=RPORT):
+    """
+    Setup connection to remote Rserve for unittesting.
+    If 'unixSocket' is given Rserve listens on this unix domain socket instead
+    of 'port'.
+    """
     # Start Rserve
-    rProc = subprocess.Popen(
-        ['R', 'CMD', RSERVE_PATH, '--no-save', '--RS-conf',
-         os.path.join(HERE_PATH, 'test.conf'),
-         '--RS-port', str(RPORT)],
-        stdout=open('/dev/null'), stderr=subprocess.PIPE)
+    args = ['R', 'CMD', RSERVE_PATH, '--no-save', '--RS-conf',
+            os.path.join(HERE_PATH, 'test.conf')]
+    if unixSocket:
+        args += ['--RS-socket', unixSocket]
+        family, address = socket.AF_UNIX, unixSocket
+    else:
+        args += ['--RS-port', str(port)]
+        family, address = socket.AF_INET, ('', port)
+    rProc = subprocess.Popen(args, stdout=open('/dev/null'),
+                             stderr=subprocess.PIPE)
     # wait a moment until Rserve starts listening on RPORT
     time.sleep(0.6)
     if rProc.poll():
@@ -41,14 +50,14 @@ def start_pyRserve():
     defaultTimeout = socket.getdefaulttimeout()
     socket.setdefaulttimeout(1)
 
-    rserv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    rserv = socket.socket(family, socket.SOCK_STREAM)
     cnt = 0
     # give it a maximum of 10 tries with some sleep in between to wait for
     # Rserve to come into action!
     while cnt < 10:
         try:
             # open a socket connection to Rserve
-            rserv.connect(('', RPORT))
+            rserv.connect(address)
         except socket.error:
             time.sleep(0.3)
             cnt += 1